@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+    benchmarks/board_sizes.py
+    -------------------------
+    Measures how solve time and response size grow with board size,
+    from 3x3 up to the 50x50 limit of the solve endpoint.
+
+    Run from the project root:
+
+        python benchmarks/board_sizes.py [--boards N] [--seed S]
+
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demos.fifteen import FifteenSolver, count_inversions
+
+SIZES = [(3, 3), (4, 4), (5, 5), (3, 12), (8, 8), (10, 10),
+         (16, 16), (25, 25), (32, 32), (50, 50)]
+
+
+def random_board(height, width, rng):
+    """
+    Shuffle a board uniformly and fix its parity so it can be solved
+    Returns a list of rows
+    """
+    tiles = list(range(height * width))
+    rng.shuffle(tiles)
+
+    inversions = count_inversions([tile for tile in tiles if tile])
+    if width % 2 == 0:
+        inversions += tiles.index(0) // width
+    if inversions % 2:
+        # Swapping two non-blank tiles flips the parity
+        first, second = [pos for pos, tile in enumerate(tiles) if tile][:2]
+        tiles[first], tiles[second] = tiles[second], tiles[first]
+
+    return [tiles[row * width:(row + 1) * width] for row in range(height)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve time and response size by board size.')
+    parser.add_argument('--boards', type=int, default=3,
+                        help='boards per size (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print('{:>7} {:>10} {:>10} {:>12} {:>12}'.format(
+        'size', 'solve (s)', 'moves', 'JSON bytes', 'moves/s'))
+    for height, width in SIZES:
+        elapsed = moves = payload = 0
+        for _ in range(args.boards):
+            board = random_board(height, width, rng)
+            started = time.time()
+            move_str = FifteenSolver(height, width, board).solve_puzzle()
+            elapsed += time.time() - started
+            moves += len(move_str)
+            payload += len(json.dumps({'result': list(move_str)}))
+
+        print('{:>7} {:>10.3f} {:>10d} {:>12d} {:>12.0f}'.format(
+            '{}x{}'.format(height, width), elapsed / args.boards,
+            moves // args.boards, payload // args.boards,
+            moves / elapsed if elapsed else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+    benchmarks/projects_queries.py
+    ------------------------------
+    Counts the SQL statements behind one request to /projects as the
+    project list grows. The page should cost the same number of
+    queries however many projects and tags there are; the run exits
+    non-zero when it does not.
+
+    Uses a throwaway SQLite database, so it is safe to run anywhere.
+    Run from the project root:
+
+        python benchmarks/projects_queries.py [--sizes 1 10 100 1000]
+
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Point the app at a scratch database before it is imported
+os.environ['OPENSHIFT_DATA_DIR'] = tempfile.mkdtemp(prefix='projects-bench-')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from homepage import app, db, database
+from homepage.models import Project, Tag
+from homepage.views import init_db
+
+TAGS_PER_PROJECT = 3
+
+
+@contextmanager
+def count_queries(*engines):
+    """
+    Count the statements executed on the engines inside the block
+    Yields a list holding the statements run so far
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        statements.append(statement)
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+
+def seed(count):
+    """ Replace the database contents with count tagged projects """
+    init_db()
+    tags = [Tag(name='tag{}'.format(index)) for index in range(20)]
+    db.session.add_all(tags)
+    for index in range(count):
+        project = Project(title='Project {}'.format(index), rank=index,
+                          url='http://example.com/{}'.format(index),
+                          description='Description {}'.format(index))
+        project.tags = [tags[(index + offset) % len(tags)]
+                        for offset in range(TAGS_PER_PROJECT)]
+        db.session.add(project)
+    db.session.commit()
+    db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='SQL queries per /projects request by project count.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    client = app.test_client()
+    # Public views may read through their own read-only engine
+    engines = [db.engine]
+    if hasattr(database, 'read_engine'):
+        engines.append(database.read_engine)
+    print('{:>9} {:>9} {:>10}'.format('projects', 'queries', 'time (s)'))
+    counts = set()
+    for size in args.sizes:
+        seed(size)
+        with count_queries(*engines) as statements:
+            started = time.time()
+            response = client.get('/projects')
+            elapsed = time.time() - started
+        if response.status_code != 200:
+            print('/projects returned {}'.format(response.status_code))
+            return 1
+        counts.add(len(statements))
+        print('{:>9} {:>9} {:>10.4f}'.format(size, len(statements), elapsed))
+
+    if len(counts) > 1:
+        print('\nQuery count grows with the number of projects')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
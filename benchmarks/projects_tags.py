@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+    benchmarks/projects_tags.py
+    ---------------------------
+    Times the /projects listing and its tag filters on a seeded
+    database of tens of thousands of projects. The SQL behind each
+    listing is timed with the indexes from homepage/models.py and again
+    on the schema from before them; whole requests are timed with the
+    indexes only, since rendering big pages outweighs the query. Prints
+    the SQLite query plan for each listing on both schemas.
+
+    Uses a throwaway SQLite database. Run from the project root:
+
+        python benchmarks/projects_tags.py [--projects 50000] [--repeat 3]
+
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Point the app at a scratch database before it is imported
+os.environ['OPENSHIFT_DATA_DIR'] = tempfile.mkdtemp(prefix='tags-bench-')
+os.environ['PAGE_CACHE_SIZE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from homepage import app, db
+from homepage.models import Project, Tag, tags
+from homepage.views import init_db, tagged_project_ids
+
+TAGS = 200
+TAGS_PER_PROJECT = 4
+
+# (label, tag names, match, query string) for each timed listing
+CASES = [
+    ('listing', [], 'all', ''),
+    ('one tag', ['tag7'], 'all', '?tag=tag7'),
+    ('all of 2', ['tag3', 'tag7'], 'all', '?tag=tag3&tag=tag7'),
+    ('any of 3', ['tag3', 'tag7', 'tag11'], 'any',
+     '?tag=tag3,tag7,tag11&match=any'),
+]
+
+INDEXES = ['ix_project_rank', 'ix_tag_name', 'ix_tags_project_id']
+
+
+def seed(count, rng):
+    """ Replace the database contents with count tagged projects """
+    init_db()
+    now = datetime.utcnow()
+    db.session.execute(Tag.__table__.insert(), [
+        {'id': index + 1, 'name': 'tag{}'.format(index), 'updated_at': now}
+        for index in range(TAGS)])
+    db.session.execute(Project.__table__.insert(), [
+        {'id': index + 1, 'title': 'Project {}'.format(index),
+         'rank': rng.randrange(count), 'url': 'http://example.com/',
+         'description': 'Description {}'.format(index), 'updated_at': now}
+        for index in range(count)])
+    db.session.execute(tags.insert(), seed_links(count, rng))
+    db.session.commit()
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    db.session.remove()
+
+
+def seed_links(count, rng):
+    """
+    Association rows for count projects, TAGS_PER_PROJECT distinct tags
+    each, drawn from a skewed distribution so a few tags are common
+    """
+    links = []
+    for project in range(1, count + 1):
+        chosen = set()
+        while len(chosen) < TAGS_PER_PROJECT:
+            chosen.add(min(TAGS, int(rng.paretovariate(0.8))))
+        links.extend({'tag_id': tag, 'project_id': project}
+                     for tag in chosen)
+    return links
+
+
+def drop_indexes():
+    """
+    Go back to the schema before the indexes: no index on rank, tag
+    name or project, and an association table without a primary key
+    """
+    for index in INDEXES:
+        db.session.execute('DROP INDEX {}'.format(index))
+    db.session.execute('CREATE TABLE tags_old (tag_id INTEGER, '
+                       'project_id INTEGER)')
+    db.session.execute('INSERT INTO tags_old SELECT tag_id, project_id '
+                       'FROM tags')
+    db.session.execute('DROP TABLE tags')
+    db.session.execute('ALTER TABLE tags_old RENAME TO tags')
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    db.session.remove()
+
+
+def listing_sql(names, match):
+    """
+    The project ids behind a listing, in rank order, as SQL text
+    Returns a string
+    """
+    with app.test_request_context():
+        query = db.session.query(Project.id)
+        if names:
+            query = query.filter(Project.id.in_(tagged_project_ids(names,
+                                                                   match)))
+        statement = query.order_by(Project.rank).statement
+        return str(statement.compile(dialect=db.engine.dialect,
+                                     compile_kwargs={'literal_binds': True}))
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def measure(client, repeat, pages):
+    """
+    Time the SQL of each of CASES and, when pages is set, the whole
+    request
+    Returns a list of dictionaries, one per case
+    """
+    results = []
+    for label, names, match, query_string in CASES:
+        sql = listing_sql(names, match)
+        elapsed, rows = best_of(
+            repeat, lambda: db.session.execute(sql).fetchall())
+        plan = [row[-1] for row in
+                db.session.execute('EXPLAIN QUERY PLAN ' + sql)]
+        result = {'label': label, 'rows': len(rows), 'query': elapsed,
+                  'plan': plan, 'page': None}
+        if pages:
+            result['page'], _ = best_of(
+                repeat, lambda: client.get('/projects' + query_string))
+        results.append(result)
+    db.session.remove()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='/projects tag filter timings with and without indexes.')
+    parser.add_argument('--projects', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    seed(args.projects, random.Random(args.seed))
+
+    client = app.test_client()
+    indexed = measure(client, args.repeat, pages=True)
+    drop_indexes()
+    unindexed = measure(client, args.repeat, pages=False)
+
+    print('{} projects, {} tags, {} tags per project\n'.format(
+        args.projects, TAGS, TAGS_PER_PROJECT))
+    print('{:>10} {:>8} {:>12} {:>12} {:>10}'.format(
+        'listing', 'rows', 'query (ms)', 'before (ms)', 'page (s)'))
+    for fast, slow in zip(indexed, unindexed):
+        print('{:>10} {:>8d} {:>12.2f} {:>12.2f} {:>10.3f}'.format(
+            fast['label'], fast['rows'], fast['query'] * 1000,
+            slow['query'] * 1000, fast['page']))
+
+    for title, results in (('with indexes', indexed),
+                           ('before the indexes', unindexed)):
+        print('\nQuery plans {}:'.format(title))
+        for result in results:
+            print('  {}:'.format(result['label']))
+            for line in result['plan']:
+                print('    ' + line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
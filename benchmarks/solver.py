@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+    benchmarks/solver.py
+    --------------------
+    Reproducible FifteenSolver benchmark suite. Every case solves the
+    same seeded boards on every run and reports wall time, moves per
+    second, solution length, peak memory (tracemalloc) and the time
+    spent in each solver phase, including the peephole pass. Results
+    are compared with benchmarks/baseline.json and the run exits
+    non-zero when a case regresses. Times are compared as multiples of
+    a fixed calibration loop timed alongside each case, so a baseline
+    written on one machine holds on a faster or slower one.
+
+    Run from the project root:
+
+        python benchmarks/solver.py              # compare with baseline
+        python benchmarks/solver.py --update     # rewrite the baseline
+
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from demos.fifteen import FifteenSolver, MOVES
+from board_sizes import random_board
+
+BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Slowdowns smaller than this many seconds per board are ignored
+NOISE_FLOOR = 0.001
+
+# Iterations of the calibration loop
+CALIBRATION_STEPS = 200000
+
+# (height, width, scramble depth or None for a uniform shuffle, boards)
+CASES = [
+    (3, 3, None, 20),
+    (4, 4, 20, 20),
+    (4, 4, 80, 20),
+    (4, 4, None, 20),
+    (5, 5, None, 10),
+    (3, 12, None, 10),
+    (8, 8, None, 5),
+    (10, 10, None, 5),
+    (16, 16, None, 2),
+    (25, 25, None, 1),
+    (50, 50, None, 1),
+]
+
+
+def scrambled_board(height, width, depth, rng):
+    """
+    Walk the blank randomly from the solved board without undoing the
+    previous move
+    Returns a list of rows
+    """
+    puzzle = FifteenSolver(height, width)
+    last = None
+    for _ in range(depth):
+        zero_row, zero_col = puzzle.current_position(0, 0)
+        choices = []
+        for direction, inverse in MOVES:
+            if inverse == last:
+                continue
+            if (direction == 'u' and zero_row == 0 or
+                    direction == 'd' and zero_row == height - 1 or
+                    direction == 'l' and zero_col == 0 or
+                    direction == 'r' and zero_col == width - 1):
+                continue
+            choices.append(direction)
+        last = rng.choice(choices)
+        puzzle.update_puzzle(last)
+    return [[puzzle.get_number(row, col) for col in range(width)]
+            for row in range(height)]
+
+
+def calibration_round():
+    """
+    Time a fixed pure-Python loop of integer, dictionary and string
+    work that does not touch the solver
+    Returns the time in seconds
+    """
+    started = time.perf_counter()
+    table = {}
+    value = 0
+    moves = ''
+    for step in range(CALIBRATION_STEPS):
+        value = (value * 31 + step) % 1000003
+        table[value & 1023] = step
+        if not step & 63:
+            moves = moves[-32:] + 'udlr'[value & 3]
+    return time.perf_counter() - started
+
+
+def case_name(height, width, depth):
+    return '{}x{}/{}'.format(height, width,
+                             'random' if depth is None else depth)
+
+
+def run_case(height, width, depth, count, seed, repeat):
+    """
+    Solve count seeded boards: repeat times for wall time, each round
+    after a calibration round (keeping the fastest of each), once
+    through iter_phases for the phase split and once under tracemalloc
+    Returns a dictionary of results
+    """
+    rng = random.Random('{}:{}'.format(seed, case_name(height, width, depth)))
+    if depth is None:
+        boards = [random_board(height, width, rng) for _ in range(count)]
+    else:
+        boards = [scrambled_board(height, width, depth, rng)
+                  for _ in range(count)]
+
+    elapsed = calibration = None
+    for _ in range(repeat):
+        calibrated = calibration_round()
+        if calibration is None or calibrated < calibration:
+            calibration = calibrated
+        spent = 0.0
+        moves = 0
+        for board in boards:
+            solver = FifteenSolver(height, width, board)
+            started = time.perf_counter()
+            moves += len(solver.solve_puzzle())
+            spent += time.perf_counter() - started
+        if elapsed is None or spent < elapsed:
+            elapsed = spent
+
+    phases = {}
+    for board in boards:
+        solver = FifteenSolver(height, width, board)
+        start = solver.clone()
+        move_strs = []
+        phase_iter = solver.iter_phases()
+        while True:
+            started = time.perf_counter()
+            try:
+                phase, move_str = next(phase_iter)
+            except StopIteration:
+                break
+            phases[phase] = phases.get(phase, 0.0) + \
+                time.perf_counter() - started
+            move_strs.append(move_str)
+
+        started = time.perf_counter()
+        start.optimize_moves(move_strs)
+        phases['peephole'] = phases.get('peephole', 0.0) + \
+            time.perf_counter() - started
+
+    peak = 0
+    for board in boards:
+        solver = FifteenSolver(height, width, board)
+        tracemalloc.start()
+        solver.solve_puzzle()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        'time': elapsed / count,
+        'calibration': calibration,
+        'moves': moves // count,
+        'moves_per_second': moves / elapsed if elapsed else 0.0,
+        'peak_memory': peak,
+        'phases': dict((phase, spent / count)
+                       for phase, spent in phases.items()),
+    }
+
+
+def compare(name, result, baseline, tolerance):
+    """
+    Check one case against its baseline entry. The baseline time is
+    scaled by how much slower this run's calibration loop was
+    Returns a list of regression messages
+    """
+    problems = []
+    if result['moves'] > baseline['moves']:
+        problems.append('{}: solution length {} > baseline {}'.format(
+            name, result['moves'], baseline['moves']))
+    # Sub-millisecond differences are timer noise, not regressions
+    expected = baseline['time'] * result['calibration'] / \
+        baseline['calibration']
+    if result['time'] > expected * (1 + tolerance) and \
+            result['time'] - expected > NOISE_FLOOR:
+        problems.append('{}: time {:.4f}s > scaled baseline {:.4f}s'.format(
+            name, result['time'], expected))
+    if result['peak_memory'] > baseline['peak_memory'] * (1 + tolerance):
+        problems.append('{}: peak memory {} > baseline {}'.format(
+            name, result['peak_memory'], baseline['peak_memory']))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark FifteenSolver against a stored baseline.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing rounds per case (default: %(default)s)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed relative slowdown or memory growth '
+                             '(default: %(default)s)')
+    parser.add_argument('--update', action='store_true',
+                        help='write the results as the new baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if not args.update and os.path.exists(args.baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    print('{:>12} {:>10} {:>8} {:>11} {:>11}  {}'.format(
+        'case', 'time (s)', 'moves', 'moves/s', 'peak (KiB)', 'phases (s)'))
+    results = {}
+    problems = []
+    for height, width, depth, count in CASES:
+        name = case_name(height, width, depth)
+        result = run_case(height, width, depth, count, args.seed,
+                          args.repeat)
+        results[name] = result
+        print('{:>12} {:>10.4f} {:>8d} {:>11.0f} {:>11.1f}  {}'.format(
+            name, result['time'], result['moves'],
+            result['moves_per_second'], result['peak_memory'] / 1024.0,
+            ' '.join('{}={:.4f}'.format(phase, spent) for phase, spent
+                     in sorted(result['phases'].items()))))
+        if name in baseline:
+            problems.extend(compare(name, result, baseline[name],
+                                    args.tolerance))
+
+    if args.update:
+        with open(args.baseline, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+            handle.write('\n')
+        print('Baseline written to {}'.format(args.baseline))
+        return 0
+
+    if problems:
+        print('\nREGRESSIONS:')
+        for problem in problems:
+            print('  ' + problem)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+    benchmarks/sqlite_concurrency.py
+    --------------------------------
+    Read latency of /projects while an admin-style writer keeps
+    committing, with SQLite left at its defaults and with the tuned
+    setup from config/default.py (WAL, pragmas, read-only connections
+    for public views). Readers run in separate processes, like WSGI
+    workers; each configuration runs in a fresh interpreter against a
+    scratch database.
+
+    Run from the project root:
+
+        python benchmarks/sqlite_concurrency.py [--readers 4] [--seconds 5]
+
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = [
+    ('default', {'SQLITE_WAL': '0', 'SQLITE_SYNCHRONOUS': 'FULL',
+                 'SQLITE_CACHE_SIZE': '-2000', 'SQLITE_MMAP_SIZE': '0',
+                 'SQLITE_READ_ONLY_VIEWS': '0'}),
+    ('tuned', {}),
+]
+
+PROJECTS = 100
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def summary(samples):
+    return {'count': len(samples),
+            'p50': percentile(samples, 0.5),
+            'p95': percentile(samples, 0.95),
+            'p99': percentile(samples, 0.99),
+            'max': max(samples) if samples else 0.0}
+
+
+def reader(seconds, results):
+    """ Reader process: request /projects until time runs out """
+    from homepage import app, db, database
+    # Connections must not be shared with the parent process
+    db.engine.dispose()
+    if hasattr(database, 'read_engine'):
+        database.read_engine.dispose()
+
+    client = app.test_client()
+    latencies = []
+    errors = 0
+    stop = time.time() + seconds
+    while time.time() < stop:
+        started = time.time()
+        response = client.get('/projects')
+        latencies.append(time.time() - started)
+        if response.status_code != 200 or b'cannot be accessed' in \
+                response.get_data():
+            errors += 1
+    results.put((latencies, errors))
+
+
+def run(readers, seconds):
+    """
+    Benchmark the configuration in this process's environment
+    Returns a dictionary of read and write latency summaries
+    """
+    sys.path.insert(0, ROOT)
+    from homepage import app, db
+    from homepage.models import Project, Tag
+    from homepage.views import init_db
+
+    init_db()
+    tags = [Tag(name='tag{}'.format(index)) for index in range(20)]
+    db.session.add_all(tags)
+    for index in range(PROJECTS):
+        project = Project(title='Project {}'.format(index), rank=index,
+                          url='http://example.com/{}'.format(index),
+                          description='Description {}'.format(index))
+        project.tags = [tags[index % len(tags)]]
+        db.session.add(project)
+    db.session.commit()
+    db.session.remove()
+    db.engine.dispose()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=reader, args=(seconds, results))
+                 for _ in range(readers)]
+    for process in processes:
+        process.start()
+
+    # Admin-style writer: one small committed edit at a time
+    writes = []
+    with app.app_context():
+        stop = time.time() + seconds
+        count = 0
+        while time.time() < stop:
+            started = time.time()
+            project = Project.query.get(count % PROJECTS + 1)
+            project.description = 'Edited {}'.format(count)
+            db.session.commit()
+            writes.append(time.time() - started)
+            count += 1
+            time.sleep(0.005)
+        db.session.remove()
+
+    reads = []
+    errors = 0
+    for _ in processes:
+        latencies, failed = results.get()
+        reads.extend(latencies)
+        errors += failed
+    for process in processes:
+        process.join()
+    return {'reads': summary(reads), 'writes': summary(writes),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='/projects read latency under concurrent writes.')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--run', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        json.dump(run(args.readers, args.seconds), sys.stdout)
+        return 0
+
+    print('{:>8} {:>6} {:>8} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+        'config', 'op', 'count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)',
+        'max (ms)', 'errors'))
+    for name, overrides in CONFIGS:
+        env = dict(os.environ, OPENSHIFT_DATA_DIR=tempfile.mkdtemp(
+            prefix='sqlite-bench-'), PAGE_CACHE_SIZE='0', **overrides)
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--run',
+             '--readers', str(args.readers), '--seconds', str(args.seconds)],
+            env=env, cwd=ROOT)
+        result = json.loads(output.decode('utf-8').splitlines()[-1])
+        for op in ('reads', 'writes'):
+            stats = result[op]
+            print('{:>8} {:>6} {:>8d} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} '
+                  '{:>7}'.format(name, op, stats['count'],
+                                 stats['p50'] * 1000, stats['p95'] * 1000,
+                                 stats['p99'] * 1000, stats['max'] * 1000,
+                                 result['errors'] if op == 'reads' else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,7 +16,66 @@ PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 APP_DIR = os.path.join(PROJECT_DIR, 'homepage')
 DATABASE =  os.path.join(os.environ.get('OPENSHIFT_DATA_DIR', APP_DIR), 'sqlite3.db')
 SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(DATABASE)
+
+# SQLite tuning: write-ahead logging lets readers and the admin writer
+# work at the same time; cache_size is in pages, or KiB when negative
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -16384))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+# Public views read through a pool of read-only connections
+SQLITE_READ_ONLY_VIEWS = os.environ.get('SQLITE_READ_ONLY_VIEWS', '1') == '1'
+SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', 5))
+
 HOST_NAME = os.environ.get('OPENSHIFT_APP_DNS', 'localhost')
 APP_NAME = os.environ.get('OPENSHIFT_APP_NAME', 'homepage')
 IP = os.environ.get('OPENSHIFT_PYTHON_IP', '127.0.0.1')
-PORT = int(os.environ.get('OPENSHIFT_PYTHON_PORT', 8080))
\ No newline at end of file
+PORT = int(os.environ.get('OPENSHIFT_PYTHON_PORT', 8080))
+
+# Largest board height or width accepted by the solve endpoints
+FIFTEEN_MAX_SIZE = int(os.environ.get('FIFTEEN_MAX_SIZE', 50))
+
+# Fifteen puzzle solver budget for mode=optimal before falling back
+OPTIMAL_NODE_LIMIT = int(os.environ.get('OPTIMAL_NODE_LIMIT', 500000))
+OPTIMAL_TIME_LIMIT = float(os.environ.get('OPTIMAL_TIME_LIMIT', 1.5))
+
+# Default latency budget in seconds for mode=anytime; requests may ask
+# for a different one with deadline=<ms>, up to OPTIMAL_TIME_LIMIT
+ANYTIME_DEADLINE = float(os.environ.get('ANYTIME_DEADLINE', 0.15))
+
+# Record solver phase timings for /metrics
+SOLVER_METRICS = os.environ.get('SOLVER_METRICS', '1') == '1'
+
+# Batch solving: worker processes (None uses every core) and request size
+SOLVER_PROCESSES = int(os.environ.get('SOLVER_PROCESSES', 0)) or None
+BATCH_MAX_BOARDS = int(os.environ.get('BATCH_MAX_BOARDS', 1000))
+
+# Solution cache: in-process LRU size and optional shared SQLite tier
+SOLUTION_CACHE_SIZE = int(os.environ.get('SOLUTION_CACHE_SIZE', 4096))
+SOLUTION_CACHE_DB = os.environ.get('SOLUTION_CACHE_DB', None)
+SOLUTION_CACHE_DB_ROWS = int(os.environ.get('SOLUTION_CACHE_DB_ROWS', 100000))
+
+# Rendered page cache: most pages kept and their lifetime in seconds
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 64))
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 300))
+
+# Seconds that files from an earlier asset build stay servable, for
+# cached pages that still link them
+ASSET_RETAIN = float(os.environ.get('ASSET_RETAIN', 7 * 24 * 3600))
+
+# Directory of a static export (python manage.py freeze) to keep up to
+# date when projects and tags are edited in the admin
+FREEZE_DIR = os.environ.get('FREEZE_DIR', None)
+
+# Asynchronous solve jobs: the SQLite file every web worker shares
+# them through, solver processes across all web workers, per-job time
+# limit and how long finished jobs are kept, in seconds
+JOB_DB = os.environ.get('JOB_DB', os.path.join(
+    os.environ.get('OPENSHIFT_DATA_DIR', APP_DIR), 'jobs.db'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_TIME_LIMIT = float(os.environ.get('JOB_TIME_LIMIT', 30))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 300))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', 100))
+# Longest a poll may wait for a job to finish, in seconds
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 25))
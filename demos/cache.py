@@ -0,0 +1,186 @@
+"""
+Solution cache for the Fifteen puzzle
+
+Solutions are keyed by a packed board encoding: every tile is stored
+in the fewest bits that hold the largest tile, so a 4x4 board packs
+into a single 64-bit integer. Lookups go to an in-process LRU first
+and then, when a database path is given, to a SQLite file that every
+worker process on the machine shares.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def pack_board(board):
+    """
+    Pack a board given as a list of rows into an integer, tile at flat
+    position i in bits [i * bits, (i + 1) * bits)
+    Returns a tuple (height, width, packed), or None when the board is
+    not a rectangular grid of tiles in range
+    """
+    try:
+        height = len(board)
+        width = len(board[0]) if height else 0
+        size = height * width
+        if not size:
+            return None
+
+        bits = max(1, (size - 1).bit_length())
+        packed = 0
+        shift = 0
+        for row in board:
+            if len(row) != width:
+                return None
+            for tile in row:
+                if not isinstance(tile, int) or not 0 <= tile < size:
+                    return None
+                packed |= tile << shift
+                shift += bits
+    except (TypeError, KeyError):
+        return None
+    return (height, width, packed)
+
+
+class SolutionCache:
+    """
+    Two-tier cache of solver results: an in-process LRU dictionary in
+    front of an optional SQLite table shared between processes
+    """
+
+    def __init__(self, max_entries=4096, path=None, max_rows=100000):
+        """
+        Create an empty cache holding up to max_entries results in
+        memory and max_rows results in the SQLite file at path
+        Returns a SolutionCache object
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.max_rows = max_rows
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _db(self):
+        """
+        Open the SQLite tier for this process, reopening after a fork
+        Returns a sqlite3 connection, or None without a database path
+        """
+        if self.path is None:
+            return None
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         check_same_thread=False)
+            connection.execute('CREATE TABLE IF NOT EXISTS solutions ('
+                               'key TEXT PRIMARY KEY, '
+                               'value TEXT NOT NULL, '
+                               'used REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS solutions_used '
+                               'ON solutions (used)')
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _db_key(key):
+        """
+        Text form of a key for the SQLite tier
+        Returns a string
+        """
+        return ':'.join('{:x}'.format(part) if isinstance(part, int)
+                        else str(part) for part in key)
+
+    def get(self, key):
+        """
+        Look up a cached result, promoting it to most recently used
+        Returns the cached value or None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            value = None
+            connection = self._db()
+            if connection is not None:
+                try:
+                    row = connection.execute(
+                        'SELECT value FROM solutions WHERE key = ?',
+                        (self._db_key(key),)).fetchone()
+                    if row is not None:
+                        value = json.loads(row[0])
+                        connection.execute(
+                            'UPDATE solutions SET used = ? WHERE key = ?',
+                            (time.time(), self._db_key(key)))
+                        connection.commit()
+                except sqlite3.Error:
+                    value = None
+
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        """
+        Store a JSON-serializable result under key in both tiers
+        """
+        with self._lock:
+            self._remember(key, value)
+
+            connection = self._db()
+            if connection is None:
+                return
+            try:
+                connection.execute(
+                    'INSERT OR REPLACE INTO solutions (key, value, used) '
+                    'VALUES (?, ?, ?)',
+                    (self._db_key(key), json.dumps(value), time.time()))
+                # Drop everything older than the max_rows newest rows;
+                # the subquery is NULL, deleting nothing, below the limit
+                connection.execute(
+                    'DELETE FROM solutions WHERE used <= ('
+                    'SELECT used FROM solutions ORDER BY used DESC '
+                    'LIMIT 1 OFFSET ?)', (self.max_rows,))
+                connection.commit()
+            except sqlite3.Error:
+                connection.rollback()
+
+    def _remember(self, key, value):
+        """
+        Insert into the in-process tier, evicting the least recently
+        used entries beyond max_entries
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Empty the in-process tier and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        """
+        Hit and miss counters for this process
+        Returns a dictionary
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'entries': len(self._entries)}
@@ -2,11 +2,332 @@
 Fifteen Puzzle
 """
 
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from demos import pattern_db
+
+# Default budget for the optimal (IDA*) search before giving up
+OPTIMAL_NODE_LIMIT = 2000000
+OPTIMAL_TIME_LIMIT = 5.0
+
+# Default latency budget for solve_anytime, in seconds
+ANYTIME_DEADLINE = 0.15
+
+# Heuristic weights solve_anytime searches with, from fast and loose
+# to exact; each search only looks for solutions shorter than the best
+ANYTIME_WEIGHTS = (3, 2, 1.5, 1.25, 1)
+
+# Blank tile moves as (direction, inverse direction)
+MOVES = (('u', 'd'), ('d', 'u'), ('l', 'r'), ('r', 'l'))
+
+# Compiled move strings are memoized up to this total size, counted as
+# moves plus cells touched, evicting the least recently used first. A
+# string bigger than the whole budget is compiled for the one call and
+# never cached
+COMPILE_CACHE_SIZE = 1 << 18
+
+# Move strings longer than this are applied piece by piece, each piece
+# a run of a unit of up to five moves repeated back to back plus the
+# moves up to the next run. A tile's macro is a one-off string, but its
+# pieces ('l' * 7, 'lddru' * 3 + 'ld', ...) recur from tile to tile
+# and stay compiled
+COMPILE_SPLIT_MOVES = 32
+MOVE_RUNS = re.compile(r'(.{1,5}?)\1+')
+
+# Compiled moves touching at least this many cells are applied with a
+# NumPy gather when NumPy is installed; below it plain Python is faster
+NUMPY_MIN_CELLS = 16
+
+# Modulus and base for the rolling board hash used by optimize_moves
+HASH_MODULUS = (1 << 61) - 1
+HASH_BASE = 1000003
+
+# optimize_moves only looks for loops longer than a cancelling pair in
+# solutions up to this many moves; on bigger boards the pass costs
+# several times the solve and saves well under one percent
+LOOP_PASS_MAX_MOVES = 1000
+
+
+def _typecode(size):
+    """
+    Pick the smallest unsigned array typecode that holds size tiles
+    Returns a string
+    """
+    if size <= 0x100:
+        return 'B'
+    if size <= 0x10000:
+        return 'H'
+    return 'L'
+
+
+CompiledMoves = namedtuple('CompiledMoves', [
+    'min_row', 'max_row', 'min_col', 'max_col',
+    'targets', 'sources', 'numpy_targets', 'numpy_sources'])
+
+
+_compiled = OrderedDict()
+_compiled_size = 0
+_compiled_lock = threading.Lock()
+
+
+def compile_moves(move_string, width):
+    """
+    Compiled moves for a move string on a board of the given width,
+    from the memo when they are there (see _compile_moves)
+    Returns a CompiledMoves tuple
+    """
+    global _compiled_size
+    key = (move_string, width)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    compiled = _compile_moves(move_string, width)
+    size = len(move_string) + len(compiled.targets)
+    if size > COMPILE_CACHE_SIZE:
+        return compiled
+    with _compiled_lock:
+        if key not in _compiled:
+            _compiled[key] = compiled
+            _compiled_size += size
+        while _compiled_size > COMPILE_CACHE_SIZE:
+            (old_string, _), old = _compiled.popitem(last=False)
+            _compiled_size -= len(old_string) + len(old.targets)
+    return compiled
+
+
+def split_moves(move_string):
+    """
+    Split a move string at the start of each run MOVE_RUNS finds; the
+    moves after a run stay with it
+    Returns a list of strings
+    """
+    starts = [run.start() for run in MOVE_RUNS.finditer(move_string)]
+    if not starts or starts[0]:
+        starts.insert(0, 0)
+    starts.append(len(move_string))
+    return [move_string[start:stop]
+            for start, stop in zip(starts, starts[1:])]
+
+
+def _compile_moves(move_string, width):
+    """
+    Turn a move string into the permutation of cells it causes on a
+    board of the given width. Offsets are flat and relative to the
+    blank's starting cell: after the moves, the cell at targets[i]
+    holds what was at sources[i] before them. The blank's row and
+    column range tells the caller whether the moves stay on the board
+    Returns a CompiledMoves tuple
+    """
+    steps = {'l': (0, -1), 'r': (0, 1), 'u': (-1, 0), 'd': (1, 0)}
+    row = col = 0
+    min_row = max_row = min_col = max_col = 0
+
+    # Maps each cell touched so far to the cell its content came from
+    origin = {}
+    for direction in move_string:
+        assert direction in steps, "invalid direction: " + direction
+        d_row, d_col = steps[direction]
+        tile_cell = (row + d_row, col + d_col)
+        origin[(row, col)] = origin.get(tile_cell, tile_cell)
+        origin[tile_cell] = None
+        row, col = tile_cell
+        min_row, max_row = min(min_row, row), max(max_row, row)
+        min_col, max_col = min(min_col, col), max(max_col, col)
+    origin[(row, col)] = (0, 0)
+
+    targets = []
+    sources = []
+    for cell, source in origin.items():
+        if cell != source:
+            targets.append(cell[0] * width + cell[1])
+            sources.append(source[0] * width + source[1])
+
+    numpy_targets = numpy_sources = None
+    if numpy is not None and len(targets) >= NUMPY_MIN_CELLS:
+        numpy_targets = numpy.array(targets, dtype=numpy.intp)
+        numpy_sources = numpy.array(sources, dtype=numpy.intp)
+    return CompiledMoves(min_row, max_row, min_col, max_col,
+                         tuple(targets), tuple(sources),
+                         numpy_targets, numpy_sources)
+
+
+def _line_conflicts(goals):
+    """
+    Count the tiles that must leave a row or column so that the
+    remaining goal positions are in increasing order
+    Returns an integer
+    """
+    # Longest increasing subsequence by patience sorting
+    tails = []
+    for goal in goals:
+        low, high = 0, len(tails)
+        while low < high:
+            mid = (low + high) // 2
+            if tails[mid] < goal:
+                low = mid + 1
+            else:
+                high = mid
+        if low == len(tails):
+            tails.append(goal)
+        else:
+            tails[low] = goal
+    return len(goals) - len(tails)
+
+
+def count_inversions(tiles):
+    """
+    Count the pairs of tiles that appear in the opposite order to
+    their values, using a Fenwick tree over tile values (O(n log n))
+    Returns an integer
+    """
+    size = max(tiles) + 1 if tiles else 0
+    tree = [0] * (size + 1)
+    inversions = 0
+    for seen, tile in enumerate(tiles):
+        # Tiles seen so far with a value no greater than this one
+        smaller = 0
+        index = tile + 1
+        while index > 0:
+            smaller += tree[index]
+            index -= index & -index
+        inversions += seen - smaller
+
+        index = tile + 1
+        while index <= size:
+            tree[index] += 1
+            index += index & -index
+    return inversions
+
+
+@lru_cache(maxsize=64)
+def _solved_template(typecode, size):
+    """
+    Solved board of the given size, flat, for slice comparisons
+    Returns an array
+    """
+    return array(typecode, range(size))
+
+
+def invariant_cells(height, width, name, target_row, target_col):
+    """
+    Cells covered by one of the solver invariants ('lower_row', 'row0'
+    or 'row1') at the given target. Every invariant asks for the blank
+    at the target and a solved tail of the board, which is at most two
+    contiguous runs of flat positions
+    Returns a tuple of the blank's flat position and a tuple of
+    (start, stop) ranges that must hold their solved tiles
+    """
+    size = height * width
+    zero = target_row * width + target_col
+    if name == 'lower_row':
+        ranges = ((zero + 1, size),)
+    elif name == 'row0':
+        # Rest of row zero, then row one from the target column on
+        ranges = ((target_col + 1, width), (width + target_col, size))
+    elif name == 'row1':
+        ranges = ((target_col + 1, width), (width + target_col + 1, size))
+    else:
+        raise ValueError("Unknown invariant: {}".format(name))
+    return zero, ranges
+
+
+def validate_boards(boards, height, width, invariant=None):
+    """
+    Check many boards of one shape in a single call: each must be
+    height rows of width tiles, hold every tile exactly once, be
+    solvable and, when invariant is a tuple (name, target_row,
+    target_col), satisfy that solver invariant. Boards are lists of
+    rows, or a NumPy array shaped (boards, height, width). With NumPy
+    the checks run on the whole batch at once
+    Returns a list of booleans, one per board
+    """
+    cells = None
+    if invariant is not None:
+        cells = invariant_cells(height, width, *invariant)
+
+    if numpy is None:
+        return [_validate_board(board, height, width, cells)
+                for board in boards]
+
+    size = height * width
+    try:
+        grids = numpy.asarray(boards)
+    except (ValueError, TypeError):
+        grids = None
+    if grids is None or grids.shape != (len(boards), height, width) or \
+            grids.dtype.kind not in 'iu':
+        # Ragged, mis-shaped or non-integer input: check the boards one
+        # at a time
+        return [_validate_board(board, height, width, cells)
+                for board in boards]
+    grids = grids.reshape(len(boards), size).astype(numpy.int64)
+
+    solved = numpy.arange(size)
+    valid = (numpy.sort(grids, axis=1) == solved).all(axis=1)
+
+    # Inversion parity, one column of the pair matrix at a time
+    parity = numpy.zeros(len(grids), dtype=numpy.int64)
+    for pos in range(size - 1):
+        later = grids[:, pos + 1:]
+        parity += ((grids[:, pos, None] > later) & (later != 0)).sum(axis=1)
+    if width % 2 == 0:
+        parity += numpy.argmin(grids, axis=1) // width
+    valid &= parity % 2 == 0
+
+    if cells is not None:
+        zero, ranges = cells
+        mask = numpy.zeros(size, dtype=bool)
+        for start, stop in ranges:
+            mask[start:stop] = True
+        valid &= grids[:, zero] == 0
+        valid &= ((grids == solved) | ~mask).all(axis=1)
+    return valid.tolist()
+
+
+def _validate_board(board, height, width, cells):
+    """
+    Pure Python check of one board for validate_boards
+    Returns a boolean
+    """
+    # FifteenSolver reads a missing board as the solved one
+    rows = (list, tuple) if numpy is None else (list, tuple, numpy.ndarray)
+    if not isinstance(board, rows) or \
+            not all(isinstance(row, rows) for row in board):
+        return False
+    try:
+        puzzle = FifteenSolver(height, width, board)
+    except ValueError:
+        return False
+    if cells is not None and not puzzle._check_invariant(cells):
+        return False
+    # Rows longer than the board are not caught by the constructor
+    return len(board) == height and all(len(row) == width for row in board)
+
+
 class FifteenSolver:
     """
     Class representation for the Fifteen puzzle
+
+    The board is stored row-major in a single flat array, so the tile
+    at (row, col) lives at index row * width + col.
     """
 
+    __slots__ = ('_height', '_width', '_grid', '_positions', '_moves_saved',
+                 '_observer')
+
     def __init__(self, puzzle_height, puzzle_width, initial_grid=None):
         """
         Initialize puzzle with default height and width
@@ -14,25 +335,45 @@ class FifteenSolver:
         """
         self._height = puzzle_height
         self._width = puzzle_width
-        self._grid = [[col + puzzle_width * row
-                       for col in range(self._width)]
-                      for row in range(self._height)]
+        size = puzzle_height * puzzle_width
+        typecode = _typecode(size)
 
         if initial_grid != None:
-            for row in range(puzzle_height):
-                for col in range(puzzle_width):
-                    self._grid[row][col] = initial_grid[row][col]
+            tiles_msg = "Board must hold each tile from 0 to {} exactly once"
+            try:
+                self._grid = array(typecode, [initial_grid[row][col]
+                                              for row in range(puzzle_height)
+                                              for col in range(puzzle_width)])
+            except (IndexError, KeyError, TypeError):
+                raise ValueError("Board must be {} rows of {} tiles".format(
+                    puzzle_height, puzzle_width))
+            except OverflowError:
+                raise ValueError(tiles_msg.format(size - 1))
+            if len(set(self._grid)) != size or max(self._grid) >= size:
+                raise ValueError(tiles_msg.format(size - 1))
+        else:
+            self._grid = array(typecode, range(size))
+
+        # Inverse index mapping each tile value to its flat position
+        self._positions = array(typecode, [0]) * size
+        for pos, value in enumerate(self._grid):
+            self._positions[value] = pos
+
+        self._moves_saved = 0
+        self._observer = None
+
+        # Reject unsolvable boards before any solving work is done
+        if initial_grid != None and not self.is_solvable():
+            raise ValueError("This board can't be solved.")
 
     def __str__(self):
         """
         Generate string representaion for puzzle
         Returns a string
         """
-        ans = ""
-        for row in range(self._height):
-            ans += str(self._grid[row])
-            ans += "\n"
-        return ans
+        width = self._width
+        return "".join(str(self._grid[start:start + width].tolist()) + "\n"
+                       for start in range(0, len(self._grid), width))
 
     #####################################
     # GUI methods
@@ -56,22 +397,69 @@ class FifteenSolver:
         Getter for the number at tile position pos
         Returns an integer
         """
-        return self._grid[row][col]
+        return self._grid[row * self._width + col]
 
     def set_number(self, row, col, value):
         """
         Setter for the number at tile position pos
         """
-        self._grid[row][col] = value
+        pos = row * self._width + col
+        self._grid[pos] = value
+        self._positions[value] = pos
 
     def clone(self):
         """
         Make a copy of the puzzle to update during solving
         Returns a Puzzle object
         """
-        new_puzzle = FifteenSolver(self._height, self._width, self._grid)
+        new_puzzle = FifteenSolver.__new__(FifteenSolver)
+        new_puzzle._height = self._height
+        new_puzzle._width = self._width
+        new_puzzle._grid = self._grid[:]
+        new_puzzle._positions = self._positions[:]
+        new_puzzle._moves_saved = 0
+        new_puzzle._observer = None
         return new_puzzle
 
+    def set_observer(self, observer):
+        """
+        Register a callable observer(phase, seconds, moves) that is told
+        how long each solving step took and how many moves it made.
+        Phases are those of iter_phases plus 'peephole', and
+        'update_puzzle' for the time spent applying moves inside them.
+        Pass None to switch the hooks off; clones start without one
+        """
+        self._observer = observer
+
+    def get_moves_saved(self):
+        """
+        Getter for the number of moves optimize_moves removed from the
+        last solve_puzzle solution
+        Returns an integer
+        """
+        return self._moves_saved
+
+    def is_solvable(self):
+        """
+        Check the inversion parity of the board. Horizontal moves never
+        change the order of the tiles; vertical moves jump a tile over
+        width - 1 others, so on even widths each row the blank moves
+        flips the parity. The solved board has no inversions and the
+        blank in row zero
+        Returns a boolean
+        """
+        inversions = count_inversions([tile for tile in self._grid if tile])
+        if self._width % 2 == 0:
+            inversions += self._positions[0] // self._width
+        return inversions % 2 == 0
+
+    def key(self):
+        """
+        Hashable snapshot of the board contents
+        Returns a bytes object
+        """
+        return self._grid.tobytes()
+
     ########################################################
     # Core puzzle methods
 
@@ -82,41 +470,94 @@ class FifteenSolver:
         Returns a tuple of two integers
         """
         solved_value = (solved_col + self._width * solved_row)
-
-        for row in range(self._height):
-            for col in range(self._width):
-                if self._grid[row][col] == solved_value:
-                    return (row, col)
-        assert False, "Value " + str(solved_value) + " not found"
+        return divmod(self._positions[solved_value], self._width)
 
     def update_puzzle(self, move_string):
         """
         Updates the puzzle state based on the provided move string
         """
-        zero_row, zero_col = self.current_position(0, 0)
+        if self._observer is not None:
+            started = time.perf_counter()
+            self._apply_moves(move_string)
+            self._observer('update_puzzle', time.perf_counter() - started,
+                           len(move_string))
+        else:
+            self._apply_moves(move_string)
+
+    def _apply_moves(self, move_string):
+        """
+        Apply a move string as precompiled cell permutations, one per
+        piece for strings longer than COMPILE_SPLIT_MOVES
+        """
+        if len(move_string) > COMPILE_SPLIT_MOVES:
+            for piece in split_moves(move_string):
+                self._apply_compiled(piece)
+        elif move_string:
+            self._apply_compiled(move_string)
+
+    def _apply_compiled(self, move_string):
+        """
+        Apply a move string as one precompiled cell permutation, falling
+        back to the character interpreter for moves that leave the
+        board so the same assertion is raised
+        """
+        width = self._width
+        compiled = compile_moves(move_string, width)
+        grid = self._grid
+        positions = self._positions
+        base = positions[0]
+        zero_row, zero_col = divmod(base, width)
+        if (zero_row + compiled.min_row < 0 or
+                zero_row + compiled.max_row >= self._height or
+                zero_col + compiled.min_col < 0 or
+                zero_col + compiled.max_col >= width):
+            self._interpret_moves(move_string)
+            return
+
+        if compiled.numpy_targets is not None:
+            dtype = 'u{}'.format(grid.itemsize)
+            board = numpy.frombuffer(grid, dtype=dtype)
+            targets = compiled.numpy_targets + base
+            tiles = board[compiled.numpy_sources + base]
+            board[targets] = tiles
+            numpy.frombuffer(positions, dtype=dtype)[tiles] = targets
+            return
+
+        tiles = [grid[base + source] for source in compiled.sources]
+        for target, tile in zip(compiled.targets, tiles):
+            grid[base + target] = tile
+            positions[tile] = base + target
+
+    def _interpret_moves(self, move_string):
+        """
+        Character interpreter, one move at a time
+        """
+        grid = self._grid
+        positions = self._positions
+        width = self._width
+        last_row = len(grid) - width
+        zero = positions[0]
         for direction in move_string:
             if direction == "l":
-                assert zero_col > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col - 1]
-                self._grid[zero_row][zero_col - 1] = 0
-                zero_col -= 1
+                assert zero % width > 0, "move off grid: " + direction
+                other = zero - 1
             elif direction == "r":
-                assert zero_col < self._width - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row][zero_col + 1]
-                self._grid[zero_row][zero_col + 1] = 0
-                zero_col += 1
+                assert zero % width < width - 1, "move off grid: " + direction
+                other = zero + 1
             elif direction == "u":
-                assert zero_row > 0, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row - 1][zero_col]
-                self._grid[zero_row - 1][zero_col] = 0
-                zero_row -= 1
+                assert zero >= width, "move off grid: " + direction
+                other = zero - width
             elif direction == "d":
-                assert zero_row < self._height - 1, "move off grid: " + direction
-                self._grid[zero_row][zero_col] = self._grid[zero_row + 1][zero_col]
-                self._grid[zero_row + 1][zero_col] = 0
-                zero_row += 1
+                assert zero < last_row, "move off grid: " + direction
+                other = zero + width
             else:
                 assert False, "invalid direction: " + direction
+            tile = grid[other]
+            grid[zero] = tile
+            grid[other] = 0
+            positions[tile] = zero
+            positions[0] = other
+            zero = other
 
     ##################################################################
     # Phase one methods
@@ -130,27 +571,24 @@ class FifteenSolver:
         All tiles in rows i to the right of pos (i,j) are positioned correctly
         Returns a boolean
         """
-        zero = (self.get_number(target_row, target_col) == 0)
-        if zero == False:
-            return False
-
-        height = self.get_height()
-        width = self.get_width()
-
-        row = height-1
-        col = width-1
-
-        # Checks if puzzle satisfies invariant
-        while row != target_row or col != target_col:
-            solved_value = col + (self.get_width() * row)
-            if self.get_number(row, col) != solved_value:
-                return False, (row, col)
-            col -= 1
-            if col < 0:
-                row -= 1
-                col = self.get_width() - 1
+        return self._check_invariant(invariant_cells(
+            self._height, self._width, 'lower_row', target_row, target_col))
 
-        return zero
+    def _check_invariant(self, cells):
+        """
+        Compare the board with the solved template over the cells of an
+        invariant, one slice comparison per flat range
+        Returns a boolean
+        """
+        zero, ranges = cells
+        if self._grid[zero] != 0:
+            return False
+        solved = _solved_template(self._grid.typecode, len(self._grid))
+        grid = self._grid
+        for start, stop in ranges:
+            if grid[start:stop] != solved[start:stop]:
+                return False
+        return True
 
     def solve_interior_tile(self, target_row, target_col):
         """
@@ -165,9 +603,7 @@ class FifteenSolver:
             left_dist = target_col - cur_col
             move_str += left_dist * 'l'
 
-            while left_dist-1 > 0:
-                move_str += 'urrdl'
-                left_dist -= 1
+            move_str += 'urrdl' * (left_dist - 1)
         # Target tile is directly above target position
         elif (cur_col == target_col):
             up_dist = target_row - cur_row
@@ -182,9 +618,7 @@ class FifteenSolver:
                 right_dist = cur_col - target_col
                 move_str += right_dist * 'r'
 
-                while right_dist-1 > 0:
-                    move_str += 'dllur'
-                    right_dist -= 1
+                move_str += 'dllur' * (right_dist - 1)
                 move_str += 'dlu'
 
                 move_str = self.down_cycle(move_str, up_dist, 'left')
@@ -197,9 +631,7 @@ class FifteenSolver:
                 right_dist = cur_col - target_col
                 move_str += right_dist * 'r'
 
-                while right_dist-1 > 0:
-                    move_str += 'ulldr'
-                    right_dist -= 1
+                move_str += 'ulldr' * (right_dist - 1)
                 move_str += 'ullddruld'
 
             # Target tile is to the left, more than one row above
@@ -210,9 +642,7 @@ class FifteenSolver:
                 left_dist = target_col - cur_col
                 move_str += left_dist * 'l'
 
-                while left_dist-1 > 0:
-                    move_str += 'drrul'
-                    left_dist -= 1
+                move_str += 'drrul' * (left_dist - 1)
                 move_str += 'dru'
 
                 move_str = self.down_cycle(move_str, up_dist, 'left')
@@ -224,9 +654,7 @@ class FifteenSolver:
                 move_str += left_dist * 'l'
                 move_str += 'urdl'
 
-                while left_dist-1 > 0:
-                    move_str += 'urrdl'
-                    left_dist -= 1
+                move_str += 'urrdl' * (left_dist - 1)
         
         #print move_str
         self.update_puzzle(move_str)
@@ -254,9 +682,7 @@ class FifteenSolver:
             right_dist = cur_col - zero_col - 1
             move_str += right_dist * 'r'
 
-            while right_dist-1 > 0:
-                move_str += 'ulldr'
-                right_dist -= 1
+            move_str += 'ulldr' * (right_dist - 1)
 
             move_str += 'ulld'
             move_str += 'ruldrdlurdluurddlur'
@@ -280,9 +706,7 @@ class FifteenSolver:
                 right_dist = cur_col - zero_col - 1
                 move_str += right_dist * 'r'
 
-                while right_dist-1 > 0:
-                    move_str += 'dllur'
-                    right_dist -= 1
+                move_str += 'dllur' * (right_dist - 1)
                 move_str += 'dlu'
 
                 move_str = self.down_cycle(move_str, up_dist, 'right')
@@ -291,9 +715,7 @@ class FifteenSolver:
             elif (cur_row+2 == target_row and cur_col-2 >= zero_col):
                 right_dist = cur_col - zero_col - 1
                 move_str += right_dist * 'r'
-                while right_dist-1 > 0:
-                    move_str += 'dllur'
-                    right_dist -= 1
+                move_str += 'dllur' * (right_dist - 1)
                 move_str += 'dluld'
                 move_str += 'ruldrdlurdluurddlur'
             # Target tile is directly above after moving 'ur'
@@ -312,15 +734,11 @@ class FifteenSolver:
         Assumes tile to move is directly below zero tile
         """
         if direction == 'left':
-            while up_dist-1 > 0:
-                move_str += 'lddru'
-                up_dist -= 1
+            move_str += 'lddru' * (up_dist - 1)
             move_str += 'ld'
 
         if direction == 'right':
-            while up_dist-1 > 0:
-                move_str += 'rddlu'
-                up_dist -= 1
+            move_str += 'rddlu' * (up_dist - 1)
             move_str += 'ld'
 
         return move_str
@@ -334,37 +752,8 @@ class FifteenSolver:
         at the given column (col > 1)
         Returns a boolean
         """
-        height = self.get_height()
-        width = self.get_width()
-        zero = (self.get_number(0, target_col) == 0)
-        if zero == False:
-            return False
-
-        # Checks first and second row
-        row0 = self._grid[0]
-        for col in range(target_col+1, width):
-            solved_value = col
-            if row0[col] != solved_value:
-                return False
-        row1 = self._grid[1]
-        for col in range(target_col, width):
-            solved_value = (col + width)
-            if row1[col] != solved_value:
-                return False
-
-        row = height-1
-        col = 0
-        # Checks n-2 rows
-        while row != 1:
-            solved_value = col + (width * row)
-            if self.get_number(row, col) != solved_value:
-                return False
-            col -= 1
-            if col < 0:
-                row -= 1
-                col = self.get_width() - 1
-
-        return zero
+        return self._check_invariant(invariant_cells(
+            self._height, self._width, 'row0', 0, target_col))
 
     def row1_invariant(self, target_col):
         """
@@ -372,37 +761,8 @@ class FifteenSolver:
         at the given column (col > 1)
         Returns a boolean
         """
-        height = self.get_height()
-        width = self.get_width()
-        zero = (self.get_number(1, target_col) == 0)
-        if zero == False:
-            return False
-
-        # Checks first and second row
-        row0 = self._grid[0]
-        for col in range(target_col+1, width):
-            solved_value = col
-            if row0[col] != solved_value:
-                return False
-        row1 = self._grid[1]
-        for col in range(target_col+1, width):
-            solved_value = (col + width)
-            if row1[col] != solved_value:
-                return False
-
-        row = height-1
-        col = 0
-        # Checks n-2 rows
-        while row != 1:
-            solved_value = col + (width * row)
-            if self.get_number(row, col) != solved_value:
-                return False
-            col -= 1
-            if col < 0:
-                row -= 1
-                col = self.get_width() - 1
-
-        return zero
+        return self._check_invariant(invariant_cells(
+            self._height, self._width, 'row1', 1, target_col))
 
     def solve_row0_tile(self, target_col):
         """
@@ -430,15 +790,11 @@ class FifteenSolver:
                 left_dist = target_col - cur_col - 1
                 move_str += left_dist * 'l'
 
-                while left_dist-1 > 0:
-                    move_str += 'urrdl'
-                    left_dist -= 1
+                move_str += 'urrdl' * (left_dist - 1)
             else:
                 left_dist = target_col - cur_col
                 move_str += left_dist * 'l'
-                while left_dist-2 > 0:
-                    move_str += 'drrul'
-                    left_dist -= 1
+                move_str += 'drrul' * (left_dist - 2)
                 move_str += 'druld'
 
         move_str += 'urdlurrdluldrruld'
@@ -458,9 +814,7 @@ class FifteenSolver:
             left_dist = target_col - cur_col
             move_str += left_dist * 'l'
 
-            while left_dist-1 > 0:
-                move_str += 'urrdl'
-                left_dist -= 1
+            move_str += 'urrdl' * (left_dist - 1)
             move_str += 'ur'
         # Target tile is above and to the left
         else:
@@ -468,9 +822,7 @@ class FifteenSolver:
             if (cur_col != target_col):
                 left_dist = target_col - cur_col
                 move_str += left_dist * 'l'
-                while left_dist-1 > 0:
-                    move_str += 'drrul'
-                    left_dist -= 1
+                move_str += 'drrul' * (left_dist - 1)
                 move_str += 'dru'
 
         self.update_puzzle(move_str)
@@ -485,9 +837,8 @@ class FifteenSolver:
         Updates the puzzle and returns a move string
         """
         move_str = ""
-        row0 = self._grid[0][:2]
-        row1 = self._grid[1][:2]
-        config = row0 + row1
+        width = self._width
+        config = self._grid[:2] + self._grid[width:width + 2]
 
         if (config[1] > config[2] and config[2] > config[0]):
             move_str += 'ul'
@@ -496,8 +847,9 @@ class FifteenSolver:
         elif (config[0] > config[1] and config[1] > config[2]):
             move_str += 'lurdlu'
         else:
-            move_str += 'lu'
-            print("This board can't be solved.")
+            # Only an odd permutation is left, which the constructor
+            # rejects unless the board was edited with set_number
+            raise ValueError("This board can't be solved.")
 
         self.update_puzzle(move_str)
         return move_str
@@ -505,30 +857,77 @@ class FifteenSolver:
     def check_pos(self, row, col):
         """
         Checks the position that needs to be moved first
+        Returns a tuple of a boolean (everything from (row, col) back to
+        the origin is solved) and the last unsolved position
         """
-        start = True
-
-        # Checks starting from highest number
-        while row != 0 or col != 0:
-            solved_value = col + (self.get_width() * row)
-            if self.get_number(row, col) != solved_value:
-                return False, (row, col)
-            col -= 1
-            if col < 0:
-                row -= 1
-                col = self.get_width() - 1
-
-        return start, (row, col)
+        grid = self._grid
+        stop = row * self._width + col + 1
+        solved = _solved_template(grid.typecode, len(grid))
+        if grid[1:stop] == solved[1:stop]:
+            return True, (0, 0)
+
+        # Binary search for the shortest unsolved suffix of grid[:stop]
+        low, high = 1, stop - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if grid[mid:stop] == solved[mid:stop]:
+                high = mid - 1
+            else:
+                low = mid
+        return False, divmod(low, self._width)
 
     def solve_puzzle(self):
         """
         Generate a solution string for a puzzle
         Updates the puzzle and returns a move string
         """
+        start = self.clone()
+        if self._observer is not None:
+            # Run the phases first so the peephole pass is timed alone
+            move_strs = list(self.iter_solve())
+            started = time.perf_counter()
+            move_str, read = start.optimize_moves(move_strs)
+            self._observer('peephole', time.perf_counter() - started,
+                           read - len(move_str))
+        else:
+            move_str, read = start.optimize_moves(self.iter_solve())
+        self._moves_saved = read - len(move_str)
+        return move_str
+
+    def iter_solve(self):
+        """
+        Lazily solve the puzzle with the phase one, two and three
+        methods, handing back each tile's moves once they are applied.
+        Only the current tile's moves are held in memory
+        Updates the puzzle and yields move strings
+        """
+        observer = self._observer
+        if observer is None:
+            for _, move_str in self.iter_phases():
+                yield move_str
+            return
+
+        phases = self.iter_phases()
+        while True:
+            started = time.perf_counter()
+            try:
+                phase, move_str = next(phases)
+            except StopIteration:
+                return
+            observer(phase, time.perf_counter() - started, len(move_str))
+            yield move_str
+
+    def iter_phases(self):
+        """
+        Run the phase one, two and three methods in order, handing back
+        each tile's moves as soon as it is placed. Phases are 'lower'
+        for the rows below row one, 'top' for the row one/row zero
+        pairs and '2x2' for the final corner
+        Updates the puzzle and yields (phase, move string) tuples
+        """
         row = self.get_height()-1
         col = self.get_width()-1
 
-        final_str = ""
         move_str = ""
         zero_row, zero_col = self.current_position(0, 0)
 
@@ -537,7 +936,7 @@ class FifteenSolver:
 
         # Board is already solved
         if (check[0] == True):
-            return final_str
+            return
         # pos is row, col of first wrong tile
         pos = check[1]
 
@@ -552,22 +951,19 @@ class FifteenSolver:
                 move_str += abs(horiz_dist) * 'l'
             down_dist = abs(pos[0] - zero_row)
             move_str += (down_dist * 'd')
-            final_str += move_str
             self.update_puzzle(move_str)
+            yield 'lower', move_str
             zero_row = pos[0]
             zero_col = pos[1]
 
-            #print final_str
             while zero_row > 1:
             # assert self.lower_row_invariant(zero_row, zero_col)
                 if zero_col == 0:
-                    move_str = self.solve_col0_tile(zero_row)
-                    final_str += move_str
+                    yield 'lower', self.solve_col0_tile(zero_row)
                     zero_col = col
                     zero_row -= 1
                 else:
-                    move_str = self.solve_interior_tile(zero_row, zero_col)
-                    final_str += move_str
+                    yield 'lower', self.solve_interior_tile(zero_row, zero_col)
                     zero_col -= 1
 
         move_str = ''
@@ -577,21 +973,420 @@ class FifteenSolver:
             move_str += 'r' * horiz_dist
             down_dist = abs(1 - zero_row)
             move_str += down_dist * 'd'
-            final_str += move_str
             self.update_puzzle(move_str)
+            yield 'top', move_str
             zero_row = 1
             zero_col = col
 
             while zero_col != 1:
                 #assert self.row1_invariant(zero_col)
                 move_str = self.solve_row1_tile(zero_col)
-                final_str += move_str
                 #assert self.row0_invariant(zero_col)
-                move_str = self.solve_row0_tile(zero_col)
-                final_str += move_str
+                move_str += self.solve_row0_tile(zero_col)
+                yield 'top', move_str
                 zero_col -= 1
-            move_str = self.solve_2x2()
-            final_str += move_str
+            yield '2x2', self.solve_2x2()
 
+    def optimize_moves(self, move_strs):
+        """
+        Peephole pass over a move string, or an iterable of move
+        strings, starting from this puzzle's state. Solutions of up to
+        LOOP_PASS_MAX_MOVES moves lose every redundant loop, checked by
+        replaying them; longer ones, or any whose check fails, only
+        lose moves that undo the one before them, such as 'lr' and
+        'ud'. Does not update the puzzle
+        Returns a tuple of the shortened move string and the number of
+        moves read
+        """
+        if isinstance(move_strs, str):
+            raw = move_strs
+        else:
+            raw = "".join(move_strs)
+
+        if len(raw) <= LOOP_PASS_MAX_MOVES:
+            move_str, end = self._drop_loops(raw)
+            if self._replay_grid(move_str) == end:
+                return move_str, len(raw)
+
+        inverses = dict(MOVES)
+        moves = []
+        for direction in raw:
+            if moves and moves[-1] == inverses[direction]:
+                moves.pop()
+            else:
+                moves.append(direction)
+        return "".join(moves), len(raw)
 
-        return final_str
+    def _drop_loops(self, move_str):
+        """
+        Whenever the board returns to a state it was already in, drop
+        the moves in between. States are tracked with a rolling hash,
+        so the result must be replayed to confirm it
+        Returns a tuple of the shortened move string and the board
+        after move_str as a list
+        """
+        width = self._width
+        grid = self._grid.tolist()
+        zero = self._positions[0]
+        offsets = {'u': -width, 'd': width, 'l': -1, 'r': 1}
+
+        powers = [1] * len(grid)
+        for pos in range(1, len(grid)):
+            powers[pos] = powers[pos - 1] * HASH_BASE % HASH_MODULUS
+        state = sum(tile * power for tile, power in zip(grid, powers))
+        state %= HASH_MODULUS
+
+        # seen maps a state hash to the length of the kept prefix that
+        # reaches it; hashes[i] is the hash after the first i moves
+        seen = {state: 0}
+        hashes = [state]
+        moves = []
+        for direction in move_str:
+            other = zero + offsets[direction]
+            tile = grid[other]
+            grid[zero] = tile
+            grid[other] = 0
+            state += tile * (powers[zero] - powers[other])
+            state %= HASH_MODULUS
+            zero = other
+
+            if state in seen:
+                kept = seen[state]
+                for dropped in hashes[kept + 1:]:
+                    del seen[dropped]
+                del hashes[kept + 1:]
+                del moves[kept:]
+            else:
+                moves.append(direction)
+                hashes.append(state)
+                seen[state] = len(moves)
+
+        return "".join(moves), grid
+
+    def _replay_grid(self, move_str):
+        """
+        Walk move_str on a copy of the board
+        Returns the resulting board as a list
+        """
+        width = self._width
+        grid = self._grid.tolist()
+        zero = self._positions[0]
+        offsets = {'u': -width, 'd': width, 'l': -1, 'r': 1}
+        for direction in move_str:
+            other = zero + offsets[direction]
+            grid[zero] = grid[other]
+            zero = other
+        grid[zero] = 0
+        return grid
+
+    #############################################################
+    # Optimal search methods
+
+    def heuristic(self):
+        """
+        Manhattan distance plus linear conflicts for the whole board
+        Never overestimates the number of moves left
+        Returns an integer
+        """
+        height = self._height
+        width = self._width
+        grid = self._grid
+        total = 0
+        for pos, tile in enumerate(grid):
+            if tile:
+                row, col = divmod(pos, width)
+                goal_row, goal_col = divmod(tile, width)
+                total += abs(row - goal_row) + abs(col - goal_col)
+        for row in range(height):
+            total += 2 * self._row_conflicts(grid, row)
+        for col in range(width):
+            total += 2 * self._col_conflicts(grid, col)
+        return total
+
+    def _row_conflicts(self, grid, row):
+        """
+        Linear conflicts between tiles that belong in the given row
+        Returns an integer
+        """
+        width = self._width
+        start = row * width
+        return _line_conflicts([tile % width
+                                for tile in grid[start:start + width]
+                                if tile and tile // width == row])
+
+    def _col_conflicts(self, grid, col):
+        """
+        Linear conflicts between tiles that belong in the given column
+        Returns an integer
+        """
+        width = self._width
+        return _line_conflicts([tile // width
+                                for tile in grid[col::width]
+                                if tile and tile % width == col])
+
+    def solve_optimal(self, node_limit=OPTIMAL_NODE_LIMIT,
+                      time_limit=OPTIMAL_TIME_LIMIT):
+        """
+        Search for a shortest solution with IDA*. 4x4 boards use the
+        additive pattern database when one has been built, every other
+        board the Manhattan distance plus linear conflict heuristic
+        Updates the puzzle and returns a move string, or returns None
+        and leaves the puzzle untouched when the node or time budget
+        runs out first
+        """
+        try:
+            return self._search_optimal(node_limit, time_limit)
+        except _SearchBudgetExceeded:
+            return None
+
+    def solve_anytime(self, deadline=ANYTIME_DEADLINE,
+                      node_limit=OPTIMAL_NODE_LIMIT):
+        """
+        Solve within a latency budget: take the phase-based solution
+        first, then search with each of ANYTIME_WEIGHTS in turn for a
+        solution shorter than the best so far, until the deadline. A
+        search that finds nothing shorter proves the best optimal and
+        ends early, as does the unweighted one finding a solution; so
+        does the first search when it finds nothing in half the budget
+        Updates the puzzle and returns a tuple of the move string and a
+        dictionary with its source ('heuristic' or 'search'), whether
+        it is known to be optimal, the heuristic solution length, the
+        number of improvements found and the time spent
+        """
+        started = time.time()
+        start = self.clone()
+        move_str = self.solve_puzzle()
+        info = {'source': 'heuristic', 'optimal': not move_str,
+                'heuristic_moves': len(move_str), 'improvements': 0}
+
+        for weight in ANYTIME_WEIGHTS:
+            remaining = deadline - (time.time() - started)
+            if info['optimal'] or remaining <= 0:
+                break
+            if weight == ANYTIME_WEIGHTS[0]:
+                # The loosest search finds a solution soonest; when it
+                # cannot within half the budget, the stricter ones
+                # will not either
+                remaining = min(remaining, deadline / 2)
+            try:
+                shorter = start.clone()._search_optimal(
+                    node_limit, remaining, len(move_str) - 1, weight)
+            except _SearchBudgetExceeded:
+                break
+            if shorter is None:
+                # Nothing shorter exists: the best so far is optimal
+                info['optimal'] = True
+            else:
+                move_str = shorter
+                info['source'] = 'search'
+                info['improvements'] += 1
+                info['optimal'] = weight == 1
+
+        info['time'] = time.time() - started
+        return move_str, info
+
+    def _search_optimal(self, node_limit, time_limit, max_cost=None,
+                        weight=1):
+        """
+        IDA* search behind solve_optimal and solve_anytime, giving up
+        once no solution of at most max_cost moves can remain. A weight
+        above 1 inflates the heuristic, so the first solution is found
+        much sooner but need not be the shortest
+        Updates the puzzle and returns a move string, or None when no
+        solution of at most max_cost moves exists; raises
+        _SearchBudgetExceeded when the node or time budget runs out
+        """
+        width = self._width
+        size = len(self._grid)
+        grid = self._grid.tolist()
+        deadline = time.time() + time_limit
+        path = []
+        nodes = [0]
+
+        database = None
+        if (self._height, width) == (pattern_db.HEIGHT, pattern_db.WIDTH):
+            database = pattern_db.load()
+        if database is not None:
+            tables = database.tables
+            tile_index = database.tile_index
+            indices = database.indices(grid)
+            estimate = database.heuristic(grid)
+        else:
+            row_conf = [self._row_conflicts(grid, row)
+                        for row in range(self._height)]
+            col_conf = [self._col_conflicts(grid, col)
+                        for col in range(width)]
+            estimate = self.heuristic()
+        offsets = {'u': -width, 'd': width, 'l': -1, 'r': 1}
+
+        def search(zero, cost, bound, estimate, last):
+            """
+            Depth-first search below the current cost bound
+            Returns True when solved, otherwise the smallest cost that
+            exceeded the bound
+            """
+            if estimate == 0:
+                return True
+            if weight != 1:
+                # Nothing below here can beat max_cost moves
+                if max_cost is not None and cost + estimate > max_cost:
+                    return None
+                total = cost + weight * estimate
+            else:
+                total = cost + estimate
+            if total > bound:
+                return total
+
+            nodes[0] += 1
+            if nodes[0] > node_limit or (not nodes[0] & 0xff and
+                                         time.time() > deadline):
+                raise _SearchBudgetExceeded()
+
+            minimum = None
+            zero_row, zero_col = divmod(zero, width)
+            for direction, inverse in MOVES:
+                if inverse == last:
+                    continue
+                if direction == 'u' and zero_row == 0:
+                    continue
+                if direction == 'd' and zero + width >= size:
+                    continue
+                if direction == 'l' and zero_col == 0:
+                    continue
+                if direction == 'r' and zero_col == width - 1:
+                    continue
+
+                # The tile slides from other into zero
+                other = zero + offsets[direction]
+                tile = grid[other]
+                grid[zero] = tile
+                grid[other] = 0
+
+                if database is not None:
+                    group, shift = tile_index[tile]
+                    saved = indices[group]
+                    indices[group] = saved ^ ((zero ^ other) << shift)
+                    delta = tables[group][indices[group]] - tables[group][saved]
+                else:
+                    goal_row, goal_col = divmod(tile, width)
+                    other_row, other_col = divmod(other, width)
+                    delta = (abs(zero_row - goal_row) +
+                             abs(zero_col - goal_col) -
+                             abs(other_row - goal_row) -
+                             abs(other_col - goal_col))
+
+                    if zero_row == other_row:
+                        lines, conf, line_conflicts = (
+                            (zero_col, other_col), col_conf,
+                            self._col_conflicts)
+                    else:
+                        lines, conf, line_conflicts = (
+                            (zero_row, other_row), row_conf,
+                            self._row_conflicts)
+                    saved = (conf[lines[0]], conf[lines[1]])
+                    for line in lines:
+                        new_conf = line_conflicts(grid, line)
+                        delta += 2 * (new_conf - conf[line])
+                        conf[line] = new_conf
+
+                path.append(direction)
+                found = search(other, cost + 1, bound, estimate + delta,
+                               direction)
+                if found is True:
+                    return True
+                path.pop()
+
+                if database is not None:
+                    indices[group] = saved
+                else:
+                    conf[lines[0]], conf[lines[1]] = saved
+                grid[other] = tile
+                grid[zero] = 0
+
+                if found is not None and (minimum is None or
+                                          found < minimum):
+                    minimum = found
+            return minimum
+
+        zero = self._positions[0]
+        bound = weight * estimate
+        while True:
+            if weight == 1 and max_cost is not None and bound > max_cost:
+                return None
+            found = search(zero, 0, bound, estimate, None)
+            if found is True:
+                break
+            if found is None:
+                return None
+            bound = found
+
+        move_str = "".join(path)
+        self.update_puzzle(move_str)
+        return move_str
+
+
+def board_size(board, max_size=None):
+    """
+    Work out the height and width of a board given as a list of rows
+    and check that the solver handles that shape. Boards two tiles
+    wide are only supported up to three rows
+    Returns a tuple of two integers, raises ValueError otherwise
+    """
+    if not isinstance(board, list) or not board or \
+            not all(isinstance(row, list) for row in board):
+        raise ValueError("Board must be a list of rows")
+
+    height = len(board)
+    width = len(board[0])
+    if any(len(row) != width for row in board):
+        raise ValueError("Board rows must all be the same length")
+    if height < 2 or width < 2:
+        raise ValueError("Board must be at least 2x2")
+    if width == 2 and height > 3:
+        raise ValueError("Boards two tiles wide can have at most 3 rows")
+    if max_size is not None and (height > max_size or width > max_size):
+        raise ValueError("Board can be at most {0}x{0}".format(max_size))
+    return height, width
+
+
+def solve_board(board, mode='heuristic', node_limit=OPTIMAL_NODE_LIMIT,
+                time_limit=OPTIMAL_TIME_LIMIT, max_size=None,
+                deadline=ANYTIME_DEADLINE):
+    """
+    Solve a board given as a list of rows. Module level so it can run
+    in a worker process; failures are reported rather than raised
+    Returns a dictionary with the moves, the mode that produced them,
+    the moves saved by the peephole pass, the solve time in seconds
+    and an error message or None; mode 'anytime' adds its details
+    under 'anytime'
+    """
+    started = time.time()
+    info = None
+    try:
+        height, width = board_size(board, max_size)
+        solver = FifteenSolver(height, width, board)
+        move_str = None
+        if mode == 'optimal':
+            move_str = solver.solve_optimal(node_limit, time_limit)
+        elif mode == 'anytime':
+            move_str, info = solver.solve_anytime(deadline, node_limit)
+        if move_str is None:
+            mode = 'heuristic'
+            move_str = solver.solve_puzzle()
+    except Exception as error:
+        return {'result': None, 'mode': mode, 'saved': 0,
+                'time': time.time() - started, 'error': str(error)}
+
+    result = {'result': move_str, 'mode': mode,
+              'saved': solver.get_moves_saved(),
+              'time': time.time() - started, 'error': None}
+    if info is not None:
+        result['anytime'] = info
+    return result
+
+
+class _SearchBudgetExceeded(Exception):
+    """
+    Raised inside the optimal search when the node or time budget
+    runs out
+    """
@@ -0,0 +1,334 @@
+"""
+Additive pattern database for the 4x4 Fifteen puzzle
+
+Each group of tiles gets a byte table holding the fewest moves of
+that group's tiles needed to bring them home, ignoring every other
+tile. The groups are disjoint, so the table values can be summed into
+a heuristic that never overestimates.
+
+Tables are indexed by the positions of the group's tiles packed four
+bits each (tile i of the group in bits 4i..4i+3), so a lookup is a few
+shifts and no ranking arithmetic. The file is read through mmap, so
+every worker process shares the same pages.
+
+Build and check the tables offline with:
+
+    python -m demos.pattern_db build [--partition 5-5-5] [--output PATH]
+    python -m demos.pattern_db verify [--output PATH]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+HEIGHT = 4
+WIDTH = 4
+SIZE = HEIGHT * WIDTH
+
+MAGIC = b'FPDB'
+VERSION = 1
+
+# Disjoint tile groups; tile 0 is the blank and belongs to none
+PARTITIONS = {
+    '5-5-5': ((1, 2, 3, 6, 7), (4, 5, 8, 9, 12), (10, 11, 13, 14, 15)),
+    '6-6-3': ((1, 2, 3, 5, 6, 7), (4, 8, 9, 12, 13, 14), (10, 11, 15)),
+}
+DEFAULT_PARTITION = '5-5-5'
+
+DEFAULT_PATH = os.environ.get(
+    'FIFTEEN_PDB', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'fifteen.pdb'))
+
+UNSET = 0xff
+
+_loaded = {}
+
+
+class PatternDatabase:
+    """
+    Read-only view of a pattern database file
+    """
+
+    def __init__(self, groups, tables, handle=None, view=None):
+        """
+        Wrap the tile groups and one table per group
+        Returns a PatternDatabase object
+        """
+        self.groups = groups
+        self.tables = tables
+        self._handle = handle
+        self._view = view
+
+        # Maps each tile to (group number, bit shift inside the index)
+        self.tile_index = [None] * SIZE
+        for group, tiles in enumerate(groups):
+            for place, tile in enumerate(tiles):
+                self.tile_index[tile] = (group, 4 * place)
+
+    def indices(self, grid):
+        """
+        Compute the table index of every group for a flat board
+        Returns a list of integers
+        """
+        indices = [0] * len(self.groups)
+        for pos, tile in enumerate(grid):
+            if tile:
+                group, shift = self.tile_index[tile]
+                indices[group] |= pos << shift
+        return indices
+
+    def heuristic(self, grid):
+        """
+        Sum of the group table entries for a flat board
+        Returns an integer
+        """
+        tables = self.tables
+        return sum(tables[group][index]
+                   for group, index in enumerate(self.indices(grid)))
+
+    def close(self):
+        """
+        Release the underlying memory map
+        """
+        if self._handle is not None:
+            for table in self.tables:
+                table.release()
+            self._view.release()
+            self._handle.close()
+            self.tables = []
+            self._handle = None
+
+
+def _neighbours():
+    """
+    List the cells next to every cell of the board
+    Returns a list of tuples
+    """
+    result = []
+    for pos in range(SIZE):
+        row, col = divmod(pos, WIDTH)
+        cells = []
+        if row > 0:
+            cells.append(pos - WIDTH)
+        if row < HEIGHT - 1:
+            cells.append(pos + WIDTH)
+        if col > 0:
+            cells.append(pos - 1)
+        if col < WIDTH - 1:
+            cells.append(pos + 1)
+        result.append(tuple(cells))
+    return result
+
+
+def build_table(tiles):
+    """
+    Breadth-first search backwards from the goal over the positions of
+    the group's tiles and the blank. Moving the blank onto another tile
+    is free, moving it onto one of the group's tiles costs one move.
+    Returns a bytearray
+    """
+    count = len(tiles)
+    shifts = [4 * place for place in range(count)]
+    blank_shift = 4 * count
+    index_mask = (1 << blank_shift) - 1
+    neighbours = _neighbours()
+
+    table = bytearray([UNSET]) * (1 << blank_shift)
+    seen = bytearray(1 << (blank_shift + 4))
+
+    start = 0
+    for tile, shift in zip(tiles, shifts):
+        start |= tile << shift
+    layer = array('L', [start])
+    cost = 0
+
+    while layer:
+        following = array('L')
+        stack = layer
+        while stack:
+            state = stack.pop()
+            if seen[state]:
+                continue
+            seen[state] = 1
+
+            index = state & index_mask
+            blank = state >> blank_shift
+            if table[index] == UNSET:
+                table[index] = cost
+
+            cells = [(index >> shift) & 0xf for shift in shifts]
+            for cell in neighbours[blank]:
+                if cell in cells:
+                    shift = shifts[cells.index(cell)]
+                    moved = (index & ~(0xf << shift)) | (blank << shift)
+                    following.append(moved | (cell << blank_shift))
+                else:
+                    moved = index | (cell << blank_shift)
+                    if not seen[moved]:
+                        stack.append(moved)
+        layer = following
+        cost += 1
+
+    # Blank positions that overlap a tile are not real configurations
+    for index in range(len(table)):
+        if table[index] == UNSET:
+            table[index] = 0
+    return table
+
+
+def write(path, groups, tables):
+    """
+    Write the header and tables to path atomically
+    """
+    header = MAGIC + struct.pack('<BB', VERSION, len(groups))
+    for tiles in groups:
+        header += struct.pack('<B', len(tiles)) + bytes(bytearray(tiles))
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(header)
+        for table in tables:
+            handle.write(table)
+    os.rename(temp_path, path)
+
+
+def open_database(path):
+    """
+    Memory-map a pattern database file
+    Returns a PatternDatabase object
+    """
+    with open(path, 'rb') as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:4] != MAGIC or mapped[4] != VERSION:
+        mapped.close()
+        raise ValueError('Not a pattern database: ' + path)
+
+    groups = []
+    offset = 6
+    for _ in range(mapped[5]):
+        length = mapped[offset]
+        groups.append(tuple(bytearray(mapped[offset + 1:offset + 1 + length])))
+        offset += 1 + length
+
+    view = memoryview(mapped)
+    tables = []
+    for tiles in groups:
+        length = 1 << (4 * len(tiles))
+        tables.append(view[offset:offset + length])
+        offset += length
+    if offset != len(mapped):
+        for table in tables:
+            table.release()
+        view.release()
+        mapped.close()
+        raise ValueError('Truncated pattern database: ' + path)
+
+    return PatternDatabase(tuple(groups), tables, mapped, view)
+
+
+def load(path=None):
+    """
+    Lazily map the pattern database the first time it is needed
+    Returns a PatternDatabase object, or None when no file was built
+    """
+    path = path or DEFAULT_PATH
+    if path not in _loaded:
+        try:
+            _loaded[path] = open_database(path)
+        except (IOError, OSError, ValueError):
+            _loaded[path] = None
+    return _loaded[path]
+
+
+def build(path, partition=DEFAULT_PARTITION):
+    """
+    Build every table of the partition and write them to path
+    """
+    groups = PARTITIONS[partition]
+    tables = []
+    for tiles in groups:
+        started = time.time()
+        tables.append(build_table(tiles))
+        print('Built table for tiles {} in {:.1f}s'.format(
+            tiles, time.time() - started))
+    write(path, groups, tables)
+    print('Wrote {} ({} bytes)'.format(path, os.path.getsize(path)))
+
+
+def verify(path, samples=1000):
+    """
+    Check a built file: every real configuration has an entry, the goal
+    costs nothing and no entry is below the Manhattan distance of the
+    group's tiles on random boards
+    Returns True when the file passes
+    """
+    database = open_database(path)
+    ok = True
+
+    for tiles, table in zip(database.groups, database.tables):
+        expected = 1
+        for place in range(len(tiles)):
+            expected *= SIZE - place
+        filled = len(table) - table.tobytes().count(b'\x00')
+        # Only the goal configuration may legitimately cost zero
+        if filled != expected - 1:
+            print('Group {}: {} entries filled, expected {}'.format(
+                tiles, filled, expected - 1))
+            ok = False
+
+    solved = list(range(SIZE))
+    if database.heuristic(solved) != 0:
+        print('Goal board does not cost zero')
+        ok = False
+
+    rng = random.Random(0)
+    for _ in range(samples):
+        grid = list(range(SIZE))
+        rng.shuffle(grid)
+        indices = database.indices(grid)
+        for group, tiles in enumerate(database.groups):
+            manhattan = 0
+            for tile in tiles:
+                row, col = divmod(grid.index(tile), WIDTH)
+                goal_row, goal_col = divmod(tile, WIDTH)
+                manhattan += abs(row - goal_row) + abs(col - goal_col)
+            if database.tables[group][indices[group]] < manhattan:
+                print('Group {} below Manhattan distance on {}'.format(
+                    tiles, grid))
+                ok = False
+                break
+
+    database.close()
+    print('{}: {}'.format(path, 'OK' if ok else 'FAILED'))
+    return ok
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    Returns a process exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m demos.pattern_db',
+        description='Build or verify the Fifteen puzzle pattern database.')
+    parser.add_argument('command', choices=('build', 'verify'))
+    parser.add_argument('--partition', default=DEFAULT_PARTITION,
+                        choices=sorted(PARTITIONS))
+    parser.add_argument('--output', default=DEFAULT_PATH,
+                        help='pattern database file (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        build(args.output, args.partition)
+        return 0 if verify(args.output) else 1
+    return 0 if verify(args.output) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
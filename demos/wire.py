@@ -0,0 +1,90 @@
+"""
+Compact wire formats for the Fifteen puzzle solve endpoint
+
+Boards travel as hex strings: tiles in row-major order, each written
+as a fixed number of hex digits, the fewest that hold the largest
+tile. A 4x4 board is one digit (nibble) per tile, so sixteen
+characters. Solutions travel as move strings, optionally run-length
+encoded: a move letter followed by a repeat count when it repeats,
+so 'rrrdl' is 'r3dl'.
+"""
+
+import re
+
+# Output formats for solutions; 'list' is the original list of moves
+MOVE_FORMATS = ('list', 'string', 'rle')
+
+_RUNS = re.compile(r'([udlr])(\d*)')
+_HEX = re.compile(r'[0-9a-fA-F]*')
+
+
+def tile_digits(size):
+    """
+    Hex digits per tile for a board of size tiles
+    Returns an integer
+    """
+    return max(1, len('{:x}'.format(size - 1)))
+
+
+def encode_board(board):
+    """
+    Encode a board given as a list of rows as a hex string
+    Returns a string
+    """
+    size = sum(len(row) for row in board)
+    fmt = '{{:0{}x}}'.format(tile_digits(size))
+    return ''.join(fmt.format(tile) for row in board for tile in row)
+
+
+def decode_board(text, width=None):
+    """
+    Decode a hex board string. The tile count follows from the length
+    of the string; the board is square unless width is given
+    Returns a list of rows, raises ValueError for malformed strings
+    """
+    length = len(text)
+    size = digits = 0
+    # Each digit count covers its own range of lengths, so at most one
+    # of them gives a consistent tile count
+    for candidate in range(1, 9):
+        if length % candidate == 0 and \
+                tile_digits(length // candidate) == candidate:
+            size, digits = length // candidate, candidate
+            break
+    if not size:
+        raise ValueError("Board string has the wrong length")
+
+    if width is None:
+        width = int(round(size ** 0.5))
+    if not isinstance(width, int) or width < 1 or size % width:
+        raise ValueError("Board string does not fill {}-wide rows".format(
+            width))
+
+    if not _HEX.fullmatch(text):
+        raise ValueError("Board string must be hexadecimal")
+    tiles = [int(text[pos:pos + digits], 16)
+             for pos in range(0, length, digits)]
+    return [tiles[start:start + width] for start in range(0, size, width)]
+
+
+def encode_moves(move_str, fmt='list'):
+    """
+    Encode a move string for a response in one of MOVE_FORMATS
+    Returns a list of moves or a string
+    """
+    if fmt == 'string':
+        return move_str
+    if fmt == 'rle':
+        return ''.join(direction + (str(len(run)) if len(run) > 1 else '')
+                       for run, direction in
+                       re.findall(r'((\w)\2*)', move_str))
+    return list(move_str)
+
+
+def decode_moves(text):
+    """
+    Expand a run-length encoded move string
+    Returns a string
+    """
+    return ''.join(direction * int(count or 1)
+                   for direction, count in _RUNS.findall(text))
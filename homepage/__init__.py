@@ -25,12 +25,21 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Initialize database
 db = SQLAlchemy(app)
 
+# Tune SQLite connections
+from homepage import database
+
 if app.debug:
     from werkzeug.debug import DebuggedApplication
     app.wsgi_app = DebuggedApplication(app.wsgi_app, True)
 
 
+# Import static asset helpers
+from homepage import assets
 # Import views
 from homepage import views
+# Import asynchronous solve jobs
+from homepage import jobs
+# Import request and solver metrics
+from homepage import metrics
 # Import admin
 from homepage import admin
\ No newline at end of file
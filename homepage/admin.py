@@ -8,6 +8,8 @@ from jinja2 import Markup
 
 from homepage import app, db
 from homepage.models import Project, Tag
+from homepage.page_cache import page_cache
+from homepage.freeze import TAG_PAGES, refreeze
 
 
 def validate_login(form, field):
@@ -58,9 +60,23 @@ class AuthIndexView(AdminIndexView):
 
 
 class AuthModelView(ModelView):
+    # Cached pages and frozen routes that show this model
+    cached_pages = ('projects',)
+    frozen_pages = ('/projects', TAG_PAGES)
+
     def is_accessible(self):
         return session.get('is_authenticated', False)
 
+    def after_model_change(self, form, model, is_created):
+        self.pages_changed()
+
+    def after_model_delete(self, model):
+        self.pages_changed()
+
+    def pages_changed(self):
+        page_cache.invalidate(*self.cached_pages)
+        refreeze(self.frozen_pages)
+
     def _handle_view(self, name , **kwargs):
         if not self.is_accessible():
             return redirect(url_for('admin.login', next=request.url))
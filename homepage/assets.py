@@ -0,0 +1,230 @@
+"""
+    homepage/assets.py
+    ------------------
+    Fingerprinted, precompressed static assets. The build step copies
+    each file under homepage/static to homepage/static/build with a
+    content hash in its name, writes gzip (and, when the brotli module
+    is installed, brotli) variants next to it and records the names in
+    a manifest:
+
+        python manage.py assets
+
+    Templates link assets with asset_url(filename), which points at the
+    fingerprinted copy once the build has run and at the plain static
+    file before that. Fingerprinted files never change, so they are
+    served with far-future immutable cache headers, picking whichever
+    precompressed variant the client accepts. Running processes pick up
+    a new build when the manifest changes, and files from earlier builds
+    stay servable for ASSET_RETAIN seconds for pages that still link
+    them.
+
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import request, url_for, send_from_directory, abort
+
+from homepage import app
+
+BUILD_DIR = os.path.join(app.static_folder, 'build')
+MANIFEST = os.path.join(BUILD_DIR, 'manifest.json')
+
+# Only text formats are worth compressing; images are already compressed
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.xml', '.ico', '.html',
+                '.txt')
+
+# Precompressed variants as (Accept-Encoding token, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+EMPTY_MANIFEST = {'files': {}, 'encodings': {}, 'retired': {}}
+
+# The manifest as last read, and the modification time it was read at
+_manifest = None
+_manifest_mtime = None
+
+
+def fingerprint(path):
+    """
+    Short content hash of a file
+    Returns a string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def compress(path):
+    """
+    Write gzip and brotli variants of path, keeping only those that are
+    smaller than the original
+    Returns a list of the suffixes written
+    """
+    with open(path, 'rb') as handle:
+        data = handle.read()
+
+    variants = [('.gz', gzip.compress(data, 9))]
+    if brotli is not None:
+        variants.insert(0, ('.br', brotli.compress(data)))
+
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as handle:
+                handle.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def build(static_dir=app.static_folder, build_dir=BUILD_DIR,
+          retain=app.config['ASSET_RETAIN']):
+    """
+    Fingerprint and precompress every static file into build_dir. Files
+    of earlier builds are kept and listed as retired, so pages rendered
+    before the build can still load them, and deleted once they have
+    been retired for retain seconds
+    Returns the manifest dictionary
+    """
+    if not os.path.isdir(build_dir):
+        os.makedirs(build_dir)
+    manifest_path = os.path.join(build_dir, 'manifest.json')
+    previous = read_manifest(manifest_path)
+    now = time.time()
+
+    manifest = {'files': {}, 'encodings': {}, 'retired': {}}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [name for name in dirs
+                   if os.path.join(root, name) != build_dir]
+        for name in files:
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = '{}.{}{}'.format(stem, fingerprint(source), ext)
+            manifest['files'][logical] = hashed
+
+            # The same name means the same content, already built
+            target = os.path.join(build_dir, hashed)
+            if hashed in previous['encodings'] and os.path.exists(target):
+                manifest['encodings'][hashed] = previous['encodings'][hashed]
+                continue
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            shutil.copyfile(source, target)
+            manifest['encodings'][hashed] = \
+                compress(target) if ext.lower() in COMPRESSIBLE else []
+
+    expired = []
+    for hashed, suffixes in previous['encodings'].items():
+        if hashed in manifest['encodings']:
+            continue
+        retired = previous['retired'].get(hashed, now)
+        if now - retired < retain:
+            manifest['encodings'][hashed] = suffixes
+            manifest['retired'][hashed] = retired
+        else:
+            expired.append(hashed)
+
+    # New files are in place before the manifest that names them, and
+    # expired ones go only once it no longer does
+    handle, temp = tempfile.mkstemp(dir=build_dir)
+    with os.fdopen(handle, 'w') as temp_file:
+        json.dump(manifest, temp_file, indent=2, sort_keys=True)
+    os.chmod(temp, 0o644)
+    os.replace(temp, manifest_path)
+
+    for hashed in expired:
+        for suffix in [''] + previous['encodings'][hashed]:
+            try:
+                os.remove(os.path.join(build_dir, hashed + suffix))
+            except OSError:
+                pass
+    return manifest
+
+
+def read_manifest(path=MANIFEST):
+    """
+    Read a build manifest, empty when there is none
+    Returns a dictionary
+    """
+    try:
+        with open(path) as handle:
+            manifest = json.load(handle)
+    except (IOError, ValueError):
+        manifest = {}
+    for key, value in EMPTY_MANIFEST.items():
+        manifest.setdefault(key, dict(value))
+    return manifest
+
+
+def load_manifest():
+    """
+    The current manifest, read again whenever a build replaces it, with
+    'hashed' holding every fingerprinted file that may be served
+    Returns a dictionary
+    """
+    global _manifest, _manifest_mtime
+    mtime = manifest_mtime()
+    if _manifest is None or mtime != _manifest_mtime:
+        manifest = read_manifest()
+        manifest['hashed'] = set(manifest['encodings'])
+        _manifest, _manifest_mtime = manifest, mtime
+    return _manifest
+
+
+def manifest_mtime():
+    """
+    When the assets were last built, 0 if they never were. Pages that
+    link assets change with every build
+    Returns a float
+    """
+    try:
+        return os.path.getmtime(MANIFEST)
+    except OSError:
+        return 0.0
+
+
+@app.template_global()
+def asset_url(filename):
+    """ URL of the fingerprinted copy of a static file, if it is built """
+    hashed = load_manifest()['files'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    manifest = load_manifest()
+    if filename not in manifest['hashed']:
+        abort(404)
+
+    served = filename
+    encoding = None
+    suffixes = manifest['encodings'].get(filename, [])
+    for token, suffix in ENCODINGS:
+        if suffix in suffixes and request.accept_encodings[token]:
+            served = filename + suffix
+            encoding = token
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(BUILD_DIR, served, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
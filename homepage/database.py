@@ -0,0 +1,75 @@
+"""
+    homepage/database.py
+    --------------------
+    SQLite connection setup. Every connection gets the pragmas from the
+    configuration; with SQLITE_WAL on, the database runs in
+    write-ahead-log mode so admin writes and public reads stop blocking
+    each other. Public views read through read_session, a pool of
+    read-only connections, when SQLITE_READ_ONLY_VIEWS is on.
+
+"""
+import sqlite3
+from urllib.request import pathname2url
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from homepage import app, db
+
+
+def sqlite_pragmas(read_only=False):
+    """
+    Pragmas for a new connection, from the configuration
+    Returns a list of statements
+    """
+    config = app.config
+    pragmas = ['PRAGMA busy_timeout = {:d}'.format(config['SQLITE_BUSY_TIMEOUT']),
+               'PRAGMA cache_size = {:d}'.format(config['SQLITE_CACHE_SIZE']),
+               'PRAGMA mmap_size = {:d}'.format(config['SQLITE_MMAP_SIZE'])]
+    if read_only:
+        pragmas.append('PRAGMA query_only = ON')
+    else:
+        # The journal mode sticks to the database file, so readers
+        # pick it up from the writers
+        if config['SQLITE_WAL']:
+            pragmas.append('PRAGMA journal_mode = WAL')
+        pragmas.append('PRAGMA synchronous = {}'.format(
+            config['SQLITE_SYNCHRONOUS']))
+    return pragmas
+
+
+def configure_connection(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def connect_read_only():
+    uri = 'file:{}?mode=ro'.format(pathname2url(app.config['DATABASE']))
+    connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    configure_connection(connection, sqlite_pragmas(read_only=True))
+    return connection
+
+
+is_sqlite = db.engine.dialect.name == 'sqlite'
+
+if is_sqlite:
+    @event.listens_for(db.engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        configure_connection(dbapi_connection, sqlite_pragmas())
+
+
+if is_sqlite and app.config['SQLITE_READ_ONLY_VIEWS']:
+    # Pooled, so each connection pays for its setup once
+    read_engine = create_engine('sqlite://', creator=connect_read_only,
+                                poolclass=QueuePool,
+                                pool_size=app.config['SQLITE_READ_POOL_SIZE'])
+    read_session = scoped_session(sessionmaker(bind=read_engine))
+
+    @app.teardown_appcontext
+    def remove_read_session(exception=None):
+        read_session.remove()
+else:
+    read_session = db.session
@@ -0,0 +1,152 @@
+"""
+    homepage/freeze.py
+    ------------------
+    Static export of the public pages. Every page is rendered through
+    the app into a directory of HTML files, next to copies of the
+    static files and built assets, that any file server can serve:
+
+        python manage.py freeze [--output DIR]
+
+    Each page is written to <route>/index.html, so the server should
+    try $uri/index.html, with 404.html as its error page. Every tag gets
+    its own listing under /projects/tag/<name>; filters given as query
+    strings only work on Flask. The solve and job endpoints under
+    /projects/fifteen-puzzle/ stay on Flask, so the server must pass
+    those through. When FREEZE_DIR is set, admin edits re-render only
+    the pages that show the edited model.
+
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import url_for
+
+from homepage import app
+from homepage.assets import BUILD_DIR
+from homepage.database import read_session
+from homepage.models import Tag
+from homepage.views import tag_has_path
+
+# Public routes and the files they are frozen to
+PAGES = {
+    '/': 'index.html',
+    '/projects': 'projects/index.html',
+    '/projects/fifteen-puzzle': 'projects/fifteen-puzzle/index.html',
+}
+NOT_FOUND_PAGE = '404.html'
+
+# Stands for every per-tag listing in a list of routes to freeze
+TAG_PAGES = '/projects/tag/'
+TAG_DIR = 'projects/tag'
+
+
+def write_file(output, name, data):
+    """ Replace output/name atomically so readers never see half a page """
+    target = os.path.join(output, name)
+    directory = os.path.dirname(target)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, temp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, 'wb') as temp_file:
+        temp_file.write(data)
+    os.chmod(temp, 0o644)
+    os.replace(temp, target)
+
+
+def tag_pages():
+    """
+    Routes of the per-tag listings and the files they are frozen to.
+    Tags whose names cannot be a path segment are left out
+    Returns a dictionary
+    """
+    pages = {}
+    with app.test_request_context():
+        for name, in read_session.query(Tag.name):
+            if not tag_has_path(name):
+                continue
+            pages[url_for('projects_tag', name=name)] = \
+                '{}/{}/index.html'.format(TAG_DIR, name)
+    return pages
+
+
+def freeze_pages(output, paths):
+    """
+    Render the given routes into output. TAG_PAGES renders every
+    per-tag listing and removes those of tags that are gone
+    Returns a list of the files written
+    """
+    pages = {}
+    for path in paths:
+        if path == TAG_PAGES:
+            pages.update(tag_pages())
+        else:
+            pages[path] = PAGES[path]
+
+    client = app.test_client()
+    written = []
+    for path, name in sorted(pages.items()):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError('{} returned {}'.format(path,
+                                                       response.status_code))
+        write_file(output, name, response.get_data())
+        written.append(name)
+
+    if TAG_PAGES in paths:
+        remove_stale_tags(output, written)
+    return written
+
+
+def remove_stale_tags(output, written):
+    """ Delete per-tag listings that were not just written """
+    tag_dir = os.path.join(output, TAG_DIR)
+    if not os.path.isdir(tag_dir):
+        return
+    current = set(os.path.dirname(name) for name in written)
+    for entry in os.listdir(tag_dir):
+        if '{}/{}'.format(TAG_DIR, entry) not in current:
+            shutil.rmtree(os.path.join(tag_dir, entry), ignore_errors=True)
+
+
+def freeze(output):
+    """
+    Export every public page, including a listing per tag, the 404
+    page, the static files and any built assets into output
+    Returns a list of the pages written
+    """
+    written = freeze_pages(output, sorted(PAGES) + [TAG_PAGES])
+
+    # Any unknown route renders the not found page
+    response = app.test_client().get('/404-not-found')
+    write_file(output, NOT_FOUND_PAGE, response.get_data())
+    written.append(NOT_FOUND_PAGE)
+
+    static = os.path.join(output, 'static')
+    if os.path.isdir(static):
+        shutil.rmtree(static)
+    shutil.copytree(app.static_folder, static,
+                    ignore=shutil.ignore_patterns('build'))
+
+    assets = os.path.join(output, 'assets')
+    if os.path.isdir(assets):
+        shutil.rmtree(assets)
+    if os.path.isdir(BUILD_DIR):
+        shutil.copytree(BUILD_DIR, assets)
+    return written
+
+
+def refreeze(paths):
+    """
+    Re-render the given routes into FREEZE_DIR in a background thread,
+    away from the request and database session that triggered it.
+    Does nothing when FREEZE_DIR is not set
+    """
+    output = app.config['FREEZE_DIR']
+    if not output or not os.path.isdir(output):
+        return None
+    thread = threading.Thread(target=freeze_pages, args=(output, paths),
+                              name='refreeze')
+    thread.start()
+    return thread
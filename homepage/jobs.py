@@ -0,0 +1,380 @@
+"""
+    homepage/jobs.py
+    ----------------
+    Asynchronous solve jobs. A board is POSTed and gets a job id back
+    straight away; the solve runs in a child process from a bounded
+    pool, so a slow board can be stopped at its time limit or cancelled
+    without tying up a web worker. Clients poll the job, optionally
+    long-polling with wait=<seconds>. Jobs are kept in the SQLite file
+    JOB_DB, so any web worker process can answer for, run or cancel any
+    job, and JOB_WORKERS bounds the solver processes of all of them
+    together. Finished jobs are dropped JOB_RESULT_TTL seconds after
+    they finish.
+
+"""
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+from flask import request, jsonify, url_for
+
+from homepage import app
+from demos.fifteen import FifteenSolver, board_size, solve_board
+from demos.wire import MOVE_FORMATS, decode_board, encode_moves
+
+# Job states; every state but queued and running is final
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+
+# How often supervisors check running jobs and waiting polls check
+# the job table, in seconds
+POLL_INTERVAL = 0.05
+
+# A running job not finished this many seconds past the time limit
+# lost its web worker, and is failed by whichever process notices
+LOST_GRACE = 10
+
+JOB_FIELDS = ('id', 'status', 'mode', 'submitted', 'started', 'finished',
+              'result', 'error')
+
+
+def _run_job(connection, board, mode, node_limit, time_limit, max_size,
+             deadline):
+    """ Child process body: solve one board and send back the result """
+    try:
+        connection.send(solve_board(board, mode, node_limit, time_limit,
+                                    max_size, deadline))
+    finally:
+        connection.close()
+
+
+class JobQueue(object):
+    """
+    SQLite job table in front of at most `workers` solver processes,
+    shared by every web worker process using the same file
+    """
+
+    def __init__(self, path, workers, time_limit, result_ttl, max_queued):
+        self.path = path
+        self.workers = workers
+        self.time_limit = time_limit
+        self.result_ttl = result_ttl
+        self.max_queued = max_queued
+
+        # Solver processes started by this web worker, by job id
+        self._running = {}
+        self._changed = threading.Condition()
+        self._supervisor = None
+        self._created = False
+
+    def _db(self):
+        """
+        Open a connection to the job table, creating it on first use
+        Returns a sqlite3 connection in autocommit mode
+        """
+        connection = sqlite3.connect(self.path, timeout=5,
+                                     isolation_level=None)
+        if not self._created:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'id TEXT PRIMARY KEY, '
+                               'status TEXT NOT NULL, '
+                               'mode TEXT NOT NULL, '
+                               'args TEXT NOT NULL, '
+                               'submitted REAL NOT NULL, '
+                               'started REAL, '
+                               'finished REAL, '
+                               'result TEXT, '
+                               'error TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_status '
+                               'ON jobs (status, submitted)')
+            self._created = True
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block in a write transaction, so checks and updates
+        from different processes cannot interleave
+        Yields a sqlite3 connection
+        """
+        with closing(self._db()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def submit(self, board, mode, node_limit, time_limit, max_size,
+               deadline):
+        """
+        Queue a board for solving
+        Returns the job dictionary, or None when the queue is full
+        """
+        job = dict.fromkeys(JOB_FIELDS)
+        job.update(id=uuid.uuid4().hex, status=QUEUED, mode=mode,
+                   submitted=time.time())
+        args = json.dumps([board, mode, node_limit, time_limit, max_size,
+                           deadline])
+        with self._transaction() as connection:
+            self._sweep(connection)
+            queued, = connection.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ?',
+                (QUEUED,)).fetchone()
+            if queued >= self.max_queued:
+                return None
+            connection.execute(
+                'INSERT INTO jobs (id, status, mode, args, submitted) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (job['id'], QUEUED, mode, args, job['submitted']))
+        self._wake()
+        return job
+
+    def get(self, job_id, wait=0):
+        """
+        Look up a job, waiting up to `wait` seconds for it to finish
+        Returns the job dictionary, or None for unknown ids
+        """
+        finish_by = time.time() + wait
+        while True:
+            job = self._load(job_id)
+            remaining = finish_by - time.time()
+            if job is None or job['status'] not in (QUEUED, RUNNING) or \
+                    remaining <= 0:
+                return job
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job; finished jobs are left as they
+        are. The web worker running the job stops its solver process
+        Returns the job dictionary, or None for unknown ids
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, finished = ? '
+                'WHERE id = ? AND status IN (?, ?)',
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING))
+        self._wake()
+        return self._load(job_id)
+
+    def _load(self, job_id):
+        with closing(self._db()) as connection:
+            row = connection.execute(
+                'SELECT {} FROM jobs WHERE id = ?'.format(
+                    ', '.join(JOB_FIELDS)), (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        if job['finished'] is not None and \
+                job['finished'] < time.time() - self.result_ttl:
+            return None
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def _wake(self):
+        with self._changed:
+            if self._supervisor is None or not self._supervisor.is_alive():
+                self._supervisor = threading.Thread(target=self._supervise,
+                                                    name='solve-jobs')
+                self._supervisor.daemon = True
+                self._supervisor.start()
+            self._changed.notify_all()
+
+    def _supervise(self):
+        """
+        Start queued jobs while the shared worker limit allows, collect
+        results and enforce time limits and cancellations. Exits once
+        this process runs nothing and nothing is queued; submit starts
+        it again
+        """
+        with self._changed:
+            while True:
+                self._collect()
+                self._claim()
+                if not self._running and not self._queued():
+                    self._supervisor = None
+                    return
+                self._changed.wait(POLL_INTERVAL)
+
+    def _queued(self):
+        with closing(self._db()) as connection:
+            return connection.execute(
+                'SELECT 1 FROM jobs WHERE status = ? LIMIT 1',
+                (QUEUED,)).fetchone() is not None
+
+    def _claim(self):
+        """ Take the oldest queued jobs while fewer than workers run """
+        with self._transaction() as connection:
+            self._sweep(connection)
+            running, = connection.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ?',
+                (RUNNING,)).fetchone()
+            claimed = connection.execute(
+                'SELECT id, args FROM jobs WHERE status = ? '
+                'ORDER BY submitted LIMIT ?',
+                (QUEUED, max(0, self.workers - running))).fetchall()
+            started = time.time()
+            for job_id, _ in claimed:
+                connection.execute(
+                    'UPDATE jobs SET status = ?, started = ? WHERE id = ?',
+                    (RUNNING, started, job_id))
+
+        for job_id, args in claimed:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_run_job, args=(sender,) + tuple(json.loads(args)))
+            process.daemon = True
+            process.start()
+            sender.close()
+            self._running[job_id] = (process, receiver, started)
+
+    def _collect(self):
+        if not self._running:
+            return
+        with closing(self._db()) as connection:
+            statuses = dict(connection.execute(
+                'SELECT id, status FROM jobs WHERE id IN ({})'.format(
+                    ', '.join('?' * len(self._running))),
+                list(self._running)).fetchall())
+
+        now = time.time()
+        for job_id, (process, connection, started) in \
+                list(self._running.items()):
+            if statuses.get(job_id) != RUNNING:
+                # Cancelled, possibly by another web worker
+                self._stop(job_id)
+            elif connection.poll():
+                try:
+                    result = connection.recv()
+                except EOFError:
+                    result = None
+                self._running.pop(job_id)
+                process.join()
+                connection.close()
+                if result is None:
+                    self._finish(job_id, FAILED, error='Worker exited early.')
+                elif result['error'] is not None:
+                    self._finish(job_id, FAILED, error=result['error'])
+                else:
+                    self._finish(job_id, DONE, result=result)
+            elif not process.is_alive() and not connection.poll():
+                self._running.pop(job_id)
+                connection.close()
+                self._finish(job_id, FAILED, error='Worker exited early.')
+            elif now - started > self.time_limit:
+                self._stop(job_id)
+                self._finish(job_id, TIMEOUT, error='Solve took longer than '
+                             '{} seconds.'.format(self.time_limit))
+
+    def _stop(self, job_id):
+        process, connection, _ = self._running.pop(job_id)
+        process.terminate()
+        process.join()
+        connection.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """ Record a running job's outcome unless it was cancelled """
+        with self._transaction() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, finished = ?, result = ?, '
+                'error = ? WHERE id = ? AND status = ?',
+                (status, time.time(),
+                 None if result is None else json.dumps(result), error,
+                 job_id, RUNNING))
+
+    def _sweep(self, connection):
+        """
+        Drop expired jobs and fail running ones whose web worker went
+        away before finishing them
+        """
+        now = time.time()
+        connection.execute('DELETE FROM jobs WHERE finished < ?',
+                           (now - self.result_ttl,))
+        connection.execute(
+            'UPDATE jobs SET status = ?, finished = ?, error = ? '
+            'WHERE status = ? AND started < ?',
+            (FAILED, now, 'Worker exited early.', RUNNING,
+             now - self.time_limit - LOST_GRACE))
+
+
+job_queue = JobQueue(app.config['JOB_DB'], app.config['JOB_WORKERS'],
+                     app.config['JOB_TIME_LIMIT'],
+                     app.config['JOB_RESULT_TTL'], app.config['JOB_MAX_QUEUED'])
+
+
+def job_response(job, move_format='list'):
+    data = dict(job)
+    data['url'] = url_for('solve_job', job_id=job['id'])
+    result = data.pop('result')
+    if result is not None:
+        data['result'] = encode_moves(result['result'], move_format)
+        data['mode'] = result['mode']
+        data['saved'] = result['saved']
+        if 'anytime' in result:
+            data['anytime'] = result['anytime']
+    return data
+
+
+@app.route('/projects/fifteen-puzzle/jobs', methods=['POST'])
+def submit_job():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object.'}), 400
+    board = payload.get('board')
+    mode = payload.get('mode', 'heuristic')
+
+    # Malformed and unsolvable boards are rejected before queueing
+    try:
+        if isinstance(board, str):
+            board = decode_board(board, payload.get('width'))
+        height, width = board_size(board, app.config['FIFTEEN_MAX_SIZE'])
+        FifteenSolver(height, width, board)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    job = job_queue.submit(board, mode, app.config['OPTIMAL_NODE_LIMIT'],
+                           app.config['OPTIMAL_TIME_LIMIT'],
+                           app.config['FIFTEEN_MAX_SIZE'],
+                           app.config['ANYTIME_DEADLINE'])
+    if job is None:
+        return jsonify({'error': 'Too many queued jobs, try again later.'}), 503
+
+    data = job_response(job)
+    return jsonify(data), 202, {'Location': data['url']}
+
+
+@app.route('/projects/fifteen-puzzle/jobs/<job_id>', methods=['GET'])
+def solve_job(job_id):
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0
+    wait = max(0.0, min(wait, app.config['JOB_MAX_WAIT']))
+
+    move_format = request.args.get('format', 'list')
+    if move_format not in MOVE_FORMATS:
+        return jsonify({'error': 'Unknown format: {}'.format(move_format)}), 400
+
+    job = job_queue.get(job_id, wait)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job.'}), 404
+    return jsonify(job_response(job, move_format))
+
+
+@app.route('/projects/fifteen-puzzle/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job.'}), 404
+    return jsonify(job_response(job))
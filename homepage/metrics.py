@@ -0,0 +1,162 @@
+"""
+    homepage/metrics.py
+    -------------------
+    Request latency and solver phase metrics in the Prometheus text
+    exposition format, served at /metrics. Values are kept per worker
+    process, so solves run in the batch process pool are not counted.
+
+"""
+import threading
+import time
+
+from flask import g, request, Response
+
+from homepage import app
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+PHASE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names, values):
+    return ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"'))
+                    for name, value in zip(names, values))
+
+
+class Histogram(object):
+    """ Cumulative histogram with one series per label combination """
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets),
+                                                 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                label_str = _format_labels(self.label_names, labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        self.name, label_str, bound, cumulative))
+                lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                    self.name, label_str, count))
+                lines.append('{}_sum{{{}}} {}'.format(self.name, label_str,
+                                                      total))
+                lines.append('{}_count{{{}}} {}'.format(self.name, label_str,
+                                                        count))
+        return lines
+
+
+class Counter(object):
+    """ Monotonic counter with one series per label combination """
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} counter'.format(self.name)]
+        with self._lock:
+            for labels, value in sorted(self._series.items()):
+                lines.append('{}{{{}}} {}'.format(
+                    self.name, _format_labels(self.label_names, labels),
+                    value))
+        return lines
+
+
+class Collected(object):
+    """
+    Counter or gauge series read from collect() when /metrics is
+    scraped, for values another module already keeps
+    """
+
+    def __init__(self, name, documentation, kind, label_names, collect):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for labels, value in sorted(self.collect()):
+            label_str = _format_labels(self.label_names, labels)
+            series = '{}{{{}}}'.format(self.name, label_str) if label_str \
+                else self.name
+            lines.append('{} {}'.format(series, value))
+        return lines
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests.',
+    ('route', 'method', 'status'), LATENCY_BUCKETS)
+solver_phase_latency = Histogram(
+    'solver_phase_duration_seconds', 'Time spent in each solver phase.',
+    ('phase',), PHASE_BUCKETS)
+solver_phase_moves = Counter(
+    'solver_phase_moves_total',
+    'Moves made by each solver phase (moves removed for peephole).',
+    ('phase',))
+
+registry = [request_latency, solver_phase_latency, solver_phase_moves]
+
+
+def observe_phase(phase, seconds, moves):
+    """ FifteenSolver observer feeding the solver metrics """
+    solver_phase_latency.observe((phase,), seconds)
+    solver_phase_moves.inc((phase,), moves)
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.time()
+
+
+@app.after_request
+def record_latency(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe((route, request.method, response.status_code),
+                                time.time() - started)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return Response('\n'.join(lines) + '\n',
+                    mimetype='text/plain; version=0.0.4')
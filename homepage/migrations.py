@@ -0,0 +1,72 @@
+"""
+    homepage/migrations.py
+    ----------------------
+    In-place upgrades for existing databases that db.create_all() will
+    not touch. Each migration checks the schema first, so running them
+    again is harmless.
+
+        python -m homepage.migrations
+
+"""
+from datetime import datetime
+
+from homepage import db
+
+
+def column_names(table):
+    return set(row[1] for row in
+               db.session.execute('PRAGMA table_info({})'.format(table)))
+
+
+def add_updated_at():
+    """ Add the updated_at columns to project and tag, stamped now """
+    now = datetime.utcnow()
+    for table in ('project', 'tag'):
+        if 'updated_at' not in column_names(table):
+            db.session.execute('ALTER TABLE {} ADD COLUMN updated_at '
+                               'DATETIME'.format(table))
+            db.session.execute('UPDATE {} SET updated_at = :now'.format(table),
+                               {'now': now})
+    db.session.commit()
+
+
+def add_indexes():
+    """
+    Give the tags association table its primary key, dropping duplicate
+    and half-empty rows, and add the listing and tag filter indexes
+    """
+    primary_key = [row[1] for row in db.session.execute('PRAGMA '
+                                                        'table_info(tags)')
+                   if row[5]]
+    if not primary_key:
+        # SQLite cannot add a primary key to a table, so rebuild it
+        db.session.execute('CREATE TABLE tags_new ('
+                           'tag_id INTEGER NOT NULL REFERENCES tag (id), '
+                           'project_id INTEGER NOT NULL REFERENCES project (id), '
+                           'PRIMARY KEY (tag_id, project_id))')
+        db.session.execute('INSERT OR IGNORE INTO tags_new '
+                           'SELECT tag_id, project_id FROM tags '
+                           'WHERE tag_id IS NOT NULL '
+                           'AND project_id IS NOT NULL')
+        db.session.execute('DROP TABLE tags')
+        db.session.execute('ALTER TABLE tags_new RENAME TO tags')
+
+    db.session.execute('CREATE INDEX IF NOT EXISTS ix_tags_project_id '
+                       'ON tags (project_id)')
+    db.session.execute('CREATE INDEX IF NOT EXISTS ix_project_rank '
+                       'ON project (rank)')
+    db.session.execute('CREATE INDEX IF NOT EXISTS ix_tag_name ON tag (name)')
+    db.session.commit()
+
+
+MIGRATIONS = [add_updated_at, add_indexes]
+
+
+def migrate():
+    db.create_all()
+    for migration in MIGRATIONS:
+        migration()
+
+
+if __name__ == '__main__':
+    migrate()
@@ -3,18 +3,29 @@
     ---------
 
 """
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 from homepage import db
 
 
+# The primary key index serves lookups by tag, the second index
+# lookups by project
 tags = db.Table('tags',
-        db.Column('tag_id', db.Integer, db.ForeignKey('tag.id')),
-        db.Column('project_id', db.Integer, db.ForeignKey('project.id'))
+        db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'),
+                  primary_key=True),
+        db.Column('project_id', db.Integer, db.ForeignKey('project.id'),
+                  primary_key=True, index=True)
         )
 
 
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50))
+    name = db.Column(db.String(50), index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
 
     def __repr__(self):
         return '{}'.format(self.name)
@@ -23,9 +34,11 @@ class Tag(db.Model):
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80))
-    rank = db.Column(db.Integer)
+    rank = db.Column(db.Integer, index=True)
     url = db.Column(db.String(4000))
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     
     tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'))
 
@@ -33,4 +46,17 @@ class Project(db.Model):
         backref=db.backref('projects', lazy='dynamic'))
 
     def __repr__(self):
-        return '{}'.format(self.title)
\ No newline at end of file
+        return '{}'.format(self.title)
+
+
+# Registered on the Session class: Flask-SQLAlchemy 2.0 builds
+# db.session from a partial, which SQLAlchemy refuses to listen on
+@event.listens_for(Session, 'before_flush')
+def touch_updated_at(session, flush_context, instances):
+    # Changing only the tags of a project issues no UPDATE for its row,
+    # so onupdate alone would miss it
+    now = datetime.utcnow()
+    for instance in session.dirty:
+        if isinstance(instance, (Project, Tag)) and \
+                session.is_modified(instance):
+            instance.updated_at = now
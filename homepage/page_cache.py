@@ -0,0 +1,62 @@
+"""
+    homepage/page_cache.py
+    ----------------------
+    In-memory cache of rendered pages. Pages are dropped when an admin
+    edits the models they show (see homepage/admin.py), when they are
+    older than PAGE_CACHE_TTL seconds, or when the cache holds more
+    than PAGE_CACHE_SIZE pages. Each worker process has its own cache;
+    an edit clears it in the process that handled the edit, and views
+    that store a validator with the page catch edits made elsewhere.
+
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from homepage import app
+
+
+class PageCache(object):
+    """ Size and age bounded LRU of rendered pages """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a page rendered less than ttl seconds ago
+        Returns the page or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored, page = entry
+            if time.time() - stored > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        with self._lock:
+            self._entries[key] = (time.time(), page)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache(app.config['PAGE_CACHE_SIZE'],
+                       app.config['PAGE_CACHE_TTL'])
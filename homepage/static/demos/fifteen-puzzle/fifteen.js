@@ -151,17 +151,38 @@ function makeMatrix(dim) {
   return arr;
 }
 
+/* Packs the current board into a hex string, the fewest hex digits
+   per tile that hold the largest tile (one per tile up to 4x4) */
+function encodeBoard(dim) {
+  var digits = Math.max(1, (dim * dim - 1).toString(16).length);
+  var hex = "";
+
+  for (var i = 0; i < dim; i++) {
+    for (var j = 0; j < dim; j++) {
+      var tile = board[i][j].val.toString(16);
+      hex += repeat("0", digits - tile.length) + tile;
+    }
+  }
+  return hex;
+}
+
+/* Expands a run-length encoded move string such as "r3dl" */
+function decodeMoves(rle) {
+  return rle.replace(/([udlr])(\d+)/g, function(match, letter, count) {
+    return repeat(letter, parseInt(count, 10));
+  });
+}
+
 /* Sends current board to <app_name>/views.py */
 function createPost() {
-  var currentBoard = makeMatrix(dim);
-  var msg = {'board': JSON.stringify(currentBoard)};
+  var msg = {'hex': encodeBoard(dim), 'mode': 'anytime', 'format': 'rle'};
 
   $.ajax({
     url: 'fifteen-puzzle/solve',
     type: 'GET',
     data: msg,
     success: function(data) {
-      moveStr = data['result'];
+      moveStr = decodeMoves(data['result']);
       aiSolve(moveStr);
     },
     failure: function(data) {
@@ -319,9 +340,9 @@ function draw() {
     timeoutId = setTimeout(draw, 1);
 }
 
-/* Solves board given an array of (l,u,r,d) letters */
-function aiSolve(arr) {
-  if (arr.length == 0)
+/* Solves board given a string of (l,u,r,d) letters */
+function aiSolve(moves) {
+  if (moves.length == 0)
     update(empty, click);
   else {
       // Disables buttons
@@ -337,7 +358,7 @@ function aiSolve(arr) {
       }
 
       var defr = (new $.Deferred()).resolve();
-      arr.forEach(function(letter) {
+      moves.split('').forEach(function(letter) {
         defr = defr.pipe(function() {
           var keycode;
           // letters represented movement of empty tile,
@@ -4,13 +4,70 @@
     Defines url routes and logic
 
 """
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
 from flask import request, session, redirect, url_for, \
-        render_template, flash, abort, json, jsonify
-from sqlalchemy import exc
+        render_template, flash, abort, json, jsonify, Response, make_response
+from sqlalchemy import exc, func
+from sqlalchemy.orm import subqueryload
 
 from homepage import app, db
-from homepage.models import Project, Tag
-from demos.fifteen import FifteenSolver
+from homepage.models import Project, Tag, tags
+from homepage.assets import manifest_mtime
+from homepage.database import read_session
+from homepage.metrics import Collected, observe_phase, registry
+from homepage.page_cache import page_cache
+from demos.fifteen import FifteenSolver, board_size, solve_board
+from demos.cache import SolutionCache, pack_board
+from demos.wire import MOVE_FORMATS, decode_board, encode_moves
+
+# Worker processes for batch solves, started on first use
+_executor = None
+
+solution_cache = SolutionCache(app.config['SOLUTION_CACHE_SIZE'],
+                               app.config['SOLUTION_CACHE_DB'],
+                               app.config['SOLUTION_CACHE_DB_ROWS'])
+
+
+def solution_cache_lookups():
+    stats = solution_cache.stats()
+    return [(('memory',), stats['hits']), (('disk',), stats['disk_hits']),
+            (('miss',), stats['misses'])]
+
+
+registry.extend([
+    Collected('solution_cache_lookups_total',
+              'Solution cache lookups by the tier that answered them.',
+              'counter', ('result',), solution_cache_lookups),
+    Collected('solution_cache_entries',
+              'Results held in the in-process solution cache.', 'gauge',
+              (), lambda: [((), solution_cache.stats()['entries'])]),
+])
+
+
+def cache_key(board, mode):
+    packed = pack_board(board)
+    if packed is None:
+        return None
+    return (mode,) + packed
+
+
+def cached_solution(key):
+    """
+    Cached result for a (mode, board) key. Entries are stored under the
+    mode that produced them; older ones that a fallback filed under
+    another mode are ignored
+    Returns a dictionary, or None on a miss
+    """
+    if key is None:
+        return None
+    cached = solution_cache.get(key)
+    if cached is None or cached['mode'] != key[0]:
+        return None
+    return cached
 
 
 def init_db():
@@ -18,9 +75,70 @@ def init_db():
     db.create_all()
 
 
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def template_validator(*names):
+    """
+    ETag and Last-Modified for a page rendered from fixed templates,
+    taken from the template files' and the asset manifest's
+    modification times
+    """
+    mtimes = [os.path.getmtime(os.path.join(app.root_path,
+                                            app.template_folder, name))
+              for name in names]
+    mtimes.append(manifest_mtime())
+    return (make_etag(names, mtimes),
+            datetime.utcfromtimestamp(int(max(mtimes))))
+
+
+def projects_validator():
+    """
+    ETag and Last-Modified for the projects page: the newest update
+    and the row count of each table, so deletes change it too, plus
+    the templates
+    """
+    template_etag, template_modified = template_validator(
+        'homepage/base.html', 'homepage/projects.html')
+    count_projects = read_session.query(func.count(Project.id)).as_scalar()
+    newest_project = read_session.query(
+        func.max(Project.updated_at)).as_scalar()
+    count_tags = read_session.query(func.count(Tag.id)).as_scalar()
+    newest_tag = read_session.query(func.max(Tag.updated_at)).as_scalar()
+    row = read_session.query(count_projects, newest_project,
+                             count_tags, newest_tag).one()
+    modified = max(stamp for stamp in (row[1], row[3], template_modified)
+                   if stamp is not None)
+    return make_etag(template_etag, *row), modified
+
+
+def conditional_response(etag, last_modified, render):
+    """
+    Answer 304 Not Modified without calling render() when the request's
+    If-None-Match or If-Modified-Since header is still current
+    """
+    if request.if_none_match:
+        fresh = etag in request.if_none_match
+    else:
+        since = request.if_modified_since
+        if since is not None and since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        fresh = since is not None and \
+            last_modified.replace(microsecond=0) <= since
+
+    response = Response(status=304) if fresh else make_response(render())
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
 @app.route('/')
 def index():
-    return render_template('homepage/index.html')
+    etag, modified = template_validator('homepage/base.html',
+                                        'homepage/index.html')
+    return conditional_response(
+        etag, modified, lambda: render_template('homepage/index.html'))
 
 
 @app.errorhandler(404)
@@ -30,30 +148,286 @@ def not_found(error):
 
 @app.route('/projects')
 def projects():
+    # ?tag=a&tag=b (or tag=a,b) lists projects with all of the tags,
+    # adding match=any lists projects with any of them. Arguments are
+    # checked before the validator or the page cache is consulted
+    match = request.args.get('match', 'all')
+    if match not in ('all', 'any'):
+        abort(400)
+    names = sorted(set(name.strip() for value in request.args.getlist('tag')
+                       for name in value.split(',') if name.strip()))
+    return projects_page(names, match)
+
+
+@app.route('/projects/tag/<name>')
+def projects_tag(name):
+    # The same listing as /projects?tag=<name>, at a path of its own so
+    # the static export can hold a page per tag
+    return projects_page([name], 'all')
+
+
+def tag_has_path(name):
+    # Names that cannot be a single path segment keep the query string
+    return bool(name) and name not in ('.', '..') and '/' not in name
+
+
+@app.template_global()
+def tag_url(name):
+    """ URL of the listing of a tag's projects """
+    if tag_has_path(name):
+        return url_for('projects_tag', name=name)
+    return url_for('projects', tag=name)
+
+
+def projects_page(names, match):
+    try:
+        etag, modified = projects_validator()
+    except exc.SQLAlchemyError:
+        return render_projects(None, names, match)
+    return conditional_response(etag, modified,
+                                lambda: render_projects(etag, names, match))
+
+
+def tagged_project_ids(names, match):
+    """
+    Subquery of the ids of projects tagged with all (or any) of names,
+    answered from the tag name and association table indexes
+    """
+    query = read_session.query(tags.c.project_id) \
+                        .join(Tag, Tag.id == tags.c.tag_id) \
+                        .filter(Tag.name.in_(names))
+    if match == 'all':
+        query = query.group_by(tags.c.project_id) \
+                     .having(func.count(func.distinct(Tag.name)) == len(names))
+    return query.subquery()
+
+
+def render_projects(etag, names=(), match='all'):
+    # Cached pages are only reused while the validator still matches,
+    # which also catches edits made through other worker processes
+    key = 'projects'
+    if names:
+        key = 'projects?{}={}'.format(match, ','.join(names))
+    cached = page_cache.get(key)
+    if cached is not None and etag is not None and cached[0] == etag:
+        return cached[1]
+
     error = False
     try:
-        projects = Project.query.order_by(Project.rank).all()
+        # Tags for every project come in one extra query, not one each
+        query = read_session.query(Project) \
+                            .options(subqueryload(Project.tags))
+        if names:
+            query = query.filter(Project.id.in_(
+                tagged_project_ids(names, match)))
+        projects = query.order_by(Project.rank).all()
     except exc.SQLAlchemyError:
         error = True
         projects = []
 
-    return render_template('homepage/projects.html', projects=projects, error=error)
+    page = render_template('homepage/projects.html', projects=projects,
+                           error=error, tag_names=names, match=match)
+    # Database errors are not cached so the page recovers on its own
+    if not error and etag is not None:
+        page_cache.put(key, (etag, page))
+    return page
 
 
 # Project demos
 @app.route('/projects/fifteen-puzzle')
 def fifteen_puzzle():
-    return render_template('demos/fifteen-puzzle.html')
+    etag, modified = template_validator('homepage/base.html',
+                                        'demos/fifteen-puzzle.html')
+    return conditional_response(
+        etag, modified, lambda: render_template('demos/fifteen-puzzle.html'))
 
 @app.route('/projects/fifteen-puzzle/solve')
 def solve():
     response_data = {'result': []}
     board_msg = request.args.get('board', None)
+    board_hex = request.args.get('hex', None)
+    mode = request.args.get('mode', 'heuristic')
+    move_format = request.args.get('format', 'list')
+
+    if move_format not in MOVE_FORMATS:
+        response_data['error'] = 'Unknown format: {}'.format(move_format)
+        return jsonify(response_data), 400
+
+    if board_msg or board_hex:
+        # Malformed and unsolvable boards are rejected before solving
+        try:
+            if board_hex:
+                board_arr = decode_board(board_hex,
+                                         request.args.get('width', type=int))
+            else:
+                board_arr = json.loads(board_msg)
+            height, width = board_size(board_arr,
+                                       app.config['FIFTEEN_MAX_SIZE'])
+            solver = FifteenSolver(height, width, board_arr)
+        except ValueError as error:
+            response_data['error'] = str(error)
+            return jsonify(response_data), 400
+
+        if app.config['SOLVER_METRICS']:
+            solver.set_observer(observe_phase)
+
+        if request.args.get('stream'):
+            return Response(stream_moves(solver, mode,
+                                         app.config['OPTIMAL_NODE_LIMIT'],
+                                         app.config['OPTIMAL_TIME_LIMIT'],
+                                         move_format),
+                            mimetype='application/x-ndjson')
+
+        key = cache_key(board_arr, mode)
+        cached = cached_solution(key)
+        if cached is not None:
+            response_data['result'] = encode_moves(cached['result'],
+                                                   move_format)
+            response_data['mode'] = cached['mode']
+            response_data['saved'] = cached['saved']
+            if 'anytime' in cached:
+                response_data['anytime'] = cached['anytime']
+            return jsonify(response_data)
+
+        move_str = None
+        if mode == 'optimal':
+            move_str = solver.solve_optimal(app.config['OPTIMAL_NODE_LIMIT'],
+                                            app.config['OPTIMAL_TIME_LIMIT'])
+        elif mode == 'anytime':
+            move_str, response_data['anytime'] = solver.solve_anytime(
+                anytime_deadline(), app.config['OPTIMAL_NODE_LIMIT'])
+        # Fall back to the phase-based solver when the search gives up
+        if move_str is None:
+            mode = 'heuristic'
+            move_str = solver.solve_puzzle();
+        response_data['result'] = encode_moves(move_str, move_format)
+        response_data['mode'] = mode
+        response_data['saved'] = solver.get_moves_saved()
+
+        # Anytime answers depend on the deadline and the machine's load,
+        # so only results that are known to be optimal are cached. A
+        # search that gave up is cached as the heuristic solution it
+        # fell back to, never under the mode that was asked for
+        if key and (mode != 'anytime' or response_data['anytime']['optimal']):
+            entry = {'result': move_str, 'mode': mode,
+                     'saved': solver.get_moves_saved()}
+            if 'anytime' in response_data:
+                entry['anytime'] = response_data['anytime']
+            solution_cache.put(cache_key(board_arr, mode), entry)
+
+    return jsonify(response_data)
+
+
+def anytime_deadline():
+    """ Latency budget in seconds for mode=anytime on this request """
+    try:
+        deadline = float(request.args['deadline']) / 1000.0
+    except (KeyError, ValueError):
+        return app.config['ANYTIME_DEADLINE']
+    return max(0.0, min(deadline, app.config['OPTIMAL_TIME_LIMIT']))
+
+
+def stream_moves(solver, mode, node_limit, time_limit, move_format='list'):
+    """
+    Yield the solution as newline-delimited JSON, one line per placed
+    tile as the solver goes, then a final 'done' line. Streamed moves
+    skip the peephole pass, which needs the whole solution.
+    """
+    if mode == 'optimal':
+        move_str = solver.solve_optimal(node_limit, time_limit)
+        if move_str is not None:
+            yield json.dumps({'phase': 'optimal',
+                              'result': encode_moves(move_str,
+                                                     move_format)}) + '\n'
+            yield json.dumps({'phase': 'done', 'mode': mode,
+                              'moves': len(move_str)}) + '\n'
+            return
+
+    moves = 0
+    for phase, move_str in solver.iter_phases():
+        if move_str:
+            moves += len(move_str)
+            yield json.dumps({'phase': phase,
+                              'result': encode_moves(move_str,
+                                                     move_format)}) + '\n'
+    yield json.dumps({'phase': 'done', 'mode': 'heuristic',
+                      'moves': moves}) + '\n'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(app.config['SOLVER_PROCESSES'])
+    return _executor
+
+
+@app.route('/projects/fifteen-puzzle/solve/batch', methods=['POST'])
+def solve_batch():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object.'}), 400
+    boards = payload.get('boards')
+    mode = payload.get('mode', 'heuristic')
+    move_format = payload.get('format', 'list')
+
+    if move_format not in MOVE_FORMATS:
+        return jsonify({'error': 'Unknown format: {}'.format(move_format)}), 400
+    if not isinstance(boards, list):
+        return jsonify({'error': 'Expected a JSON list of boards.'}), 400
+    if len(boards) > app.config['BATCH_MAX_BOARDS']:
+        return jsonify({'error': 'At most {} boards per request.'.format(
+            app.config['BATCH_MAX_BOARDS'])}), 400
+
+    # Boards may be lists of rows or square hex strings
+    decoded = []
+    for board in boards:
+        if isinstance(board, str):
+            try:
+                board = decode_board(board)
+            except ValueError as error:
+                board = error
+        decoded.append(board)
+
+    # Only boards missing from the cache are sent to the workers
+    executor = get_executor()
+    keys = [None if isinstance(board, ValueError) else cache_key(board, mode)
+            for board in decoded]
+    pending = []
+    for board, key in zip(decoded, keys):
+        cached = cached_solution(key)
+        if isinstance(board, ValueError):
+            pending.append({'result': None, 'mode': mode, 'saved': 0,
+                            'time': None, 'error': str(board)})
+        elif cached is not None:
+            pending.append(dict(cached, time=0.0, error=None))
+        else:
+            pending.append(executor.submit(solve_board, board, mode,
+                                           app.config['OPTIMAL_NODE_LIMIT'],
+                                           app.config['OPTIMAL_TIME_LIMIT'],
+                                           app.config['FIFTEEN_MAX_SIZE'],
+                                           app.config['ANYTIME_DEADLINE']))
 
-    if board_msg:
-        board_arr = json.loads(board_msg)
-        solver = FifteenSolver(4, 4, board_arr)
-        move_str = solver.solve_puzzle();
-        response_data['result'] = list(move_str)
+    # Results are collected in submission order
+    results = []
+    for key, future in zip(keys, pending):
+        if isinstance(future, dict):
+            result = future
+        else:
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {'result': None, 'mode': mode, 'saved': 0,
+                          'time': None, 'error': str(error)}
+            if key and result['error'] is None and \
+                    result.get('anytime', {'optimal': True})['optimal']:
+                entry = {'result': result['result'], 'mode': result['mode'],
+                         'saved': result['saved']}
+                if 'anytime' in result:
+                    entry['anytime'] = result['anytime']
+                # Keyed by the mode that produced the moves
+                solution_cache.put((result['mode'],) + key[1:], entry)
+        if result['result'] is not None:
+            result['result'] = encode_moves(result['result'], move_format)
+        results.append(result)
 
-    return jsonify(response_data)
\ No newline at end of file
+    return jsonify({'results': results})
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+    manage.py
+    ---------
+    Maintenance commands, run from the project root:
+
+        python manage.py migrate    # upgrade an existing database
+        python manage.py assets     # fingerprint and compress static files
+        python manage.py freeze     # export the public pages as HTML
+
+"""
+import argparse
+import sys
+
+from homepage import app, assets, freeze, migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Site maintenance commands.')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('migrate', help='upgrade an existing database')
+    commands.add_parser('assets', help='build fingerprinted static assets')
+    freeze_parser = commands.add_parser(
+        'freeze', help='export the public pages as static HTML')
+    freeze_parser.add_argument('--output', default=app.config['FREEZE_DIR'],
+                               required=not app.config['FREEZE_DIR'],
+                               help='export directory (default: FREEZE_DIR)')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrations.migrate()
+    elif args.command == 'assets':
+        files = assets.build()['files']
+        print('Built {} assets into {}'.format(len(files), assets.BUILD_DIR))
+    elif args.command == 'freeze':
+        pages = freeze.freeze(args.output)
+        print('Exported {} pages to {}'.format(len(pages), args.output))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
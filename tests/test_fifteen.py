@@ -0,0 +1,42 @@
+"""
+    tests/test_fifteen.py
+    ---------------------
+    Tests for the Fifteen puzzle board checks.
+
+    Run from the project root:
+
+        python -m pytest tests
+
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demos import fifteen
+from demos.fifteen import validate_boards
+
+SOLVED = [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+
+
+class ValidateBoardsTest(unittest.TestCase):
+
+    def check(self, boards, expected):
+        self.assertEqual(validate_boards(boards, 3, 3), expected)
+        # The pure Python path is the one that sees malformed entries
+        saved, fifteen.numpy = fifteen.numpy, None
+        try:
+            self.assertEqual(validate_boards(boards, 3, 3), expected)
+        finally:
+            fifteen.numpy = saved
+
+    def test_none_and_scalar_entries(self):
+        self.check([SOLVED, None, 7], [True, False, False])
+
+    def test_scalar_rows(self):
+        self.check([[0, 1, 2], SOLVED], [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()